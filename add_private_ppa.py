@@ -12,19 +12,31 @@ so they are not stored in plaintext in the URIs in the sources.list file.
 
 Then the URL (without the login and password) is added to the sources.list file.
 
-Finally, the PPA's key is added to the system.
+Finally, the PPA's key is added to the system (to a keyring in
+/etc/apt/trusted.gpg.d/, as apt-key is deprecated).
+
+More PPAs can be added in the same run with --extra-ppa. Once all of them are
+registered, the apt cache is refreshed once for just the newly added lists, so
+callers don't need to run `apt-get update` themselves.
 """
 
 import argparse
+import functools
 import logging
 import os
+import re
 import subprocess
 import textwrap
-from urllib.parse import urlparse
 
 logging.basicConfig(level=logging.INFO)
 logging.getLogger().name = os.path.basename(__file__)
 
+# characters that are not allowed in filenames, mapped to a dash
+_SLUG_TABLE = str.maketrans({c: "-" for c in '/\\:*?"<>| '})
+
+# path part of a http(s) URL (without the query and fragment)
+_PPA_PATH_RE = re.compile(r"^https?://[^/?#]+(/[^?#]*)")
+
 
 def neatly_run_command(cmd: list[str]) -> str:
     """
@@ -32,29 +44,43 @@ def neatly_run_command(cmd: list[str]) -> str:
     error and exit the program.
     """
     try:
-        return subprocess.check_output(cmd, universal_newlines=True)
+        return subprocess.run(
+            cmd, check=True, capture_output=True, text=True
+        ).stdout
     except FileNotFoundError as exc:
         raise SystemExit(
             "Command not found: {}".format(" ".join(cmd))
         ) from exc
     except subprocess.CalledProcessError as exc:
         raise SystemExit(
-            "Problem encountered when running {}: {}".format(
-                " ".join(cmd), exc
+            "Problem encountered when running {}: {}\n{}".format(
+                " ".join(cmd), exc, exc.stderr
             )
         ) from exc
 
 
+@functools.lru_cache(maxsize=1)
 def guess_ubuntu_codename() -> str:
     """
     Guess the Ubuntu codename.
 
-    The codename is guessed by running the lsb_release command.
+    The codename is read from /etc/os-release. If that file is not available
+    the lsb_release command is used instead. The result is cached.
     """
     logging.info("Guessing Ubuntu codename...")
-    codename = neatly_run_command(
-        ["lsb_release", "--codename", "--short"]
-    ).strip()
+    codename = ""
+    try:
+        with open("/etc/os-release", encoding="utf-8") as os_release:
+            for line in os_release:
+                if line.startswith("VERSION_CODENAME="):
+                    codename = line.split("=", 1)[1].strip().strip('"')
+                    break
+    except FileNotFoundError:
+        pass
+    if not codename:
+        codename = neatly_run_command(
+            ["lsb_release", "--codename", "--short"]
+        ).strip()
     logging.info("Ubuntu codename guessed: %s", codename)
     return codename
 
@@ -92,18 +118,7 @@ def slugify_name(name: str) -> str:
     >>> slugify_name(r"a/b\\:*?\\"<>| ")
     'a-b----------'
     """
-    return (
-        name.replace("/", "-")
-        .replace("\\", "-")
-        .replace(":", "-")
-        .replace("*", "-")
-        .replace("?", "-")
-        .replace('"', "-")
-        .replace("<", "-")
-        .replace(">", "-")
-        .replace("|", "-")
-        .replace(" ", "-")
-    )
+    return name.translate(_SLUG_TABLE)
 
 
 def create_apt_auth_file(ppa: str, login: str, password: str) -> None:
@@ -155,19 +170,20 @@ def extract_ppa_name(url: str) -> str:
         ...
     ValueError: URL is not a PPA address: not-a-url
     """
-    parsed_url = urlparse(url)
-    path = parsed_url.path
-    if not path.startswith("/"):
+    match = _PPA_PATH_RE.match(url)
+    if not match:
         raise ValueError("URL is not a PPA address: {}".format(url))
-    return path[1:]
+    return match.group(1)[1:]
 
 
-def add_ppa_to_sources_list(ppa: str) -> None:
+def add_ppa_to_sources_list(ppa: str) -> str:
     """
     Add the PPA to the sources.list file.
 
     The PPA's URL will be added to the sources.list file, with the login and
     password replaced with the name of the credentials file.
+
+    Returns the path of the sources list file.
     """
     ppa_name = slugify_name(extract_ppa_name(ppa))
     sources_list_file = "/etc/apt/sources.list.d/{}.list".format(ppa_name)
@@ -188,23 +204,51 @@ def add_ppa_to_sources_list(ppa: str) -> None:
         with open(sources_list_file, "wt", encoding="utf-8") as src_list_file:
             src_list_file.write(contents)
         logging.info("Created sources list file: %s", sources_list_file)
+    return sources_list_file
 
 
-def add_ppa_key(key: str) -> None:
+def add_ppa_keys(keys: list[str]) -> None:
     """
-    Add the PPA's key to the system.
+    Add the PPAs' keys to the system.
 
-    The PPA's key will be added to the system by running the apt-key command.
+    All the keys are fetched from the keyserver with a single gpg invocation
+    and stored in a keyring in /etc/apt/trusted.gpg.d/.
     """
-
+    keyring = "/etc/apt/trusted.gpg.d/private-ppas.gpg"
     cmd = [
-        "apt-key",
-        "adv",
+        "gpg",
+        "--batch",
+        "--no-default-keyring",
+        # apt can't read keybox files, so force the legacy keyring format
+        "--keyring",
+        "gnupg-ring:{}".format(keyring),
         "--keyserver",
         "keyserver.ubuntu.com",
         "--recv-keys",
-        key,
-    ]
+    ] + keys
+    neatly_run_command(cmd)
+    os.chmod(keyring, 0o644)
+    logging.info("Added keys to %s: %s", keyring, ", ".join(keys))
+
+
+def update_apt_cache(sources_list_files: list[str]) -> None:
+    """
+    Refresh the apt cache for the given sources list files only.
+
+    apt can only be pointed at a single sources list at a time, so if more
+    than one file was added, the whole cache is refreshed (still only once).
+    """
+    cmd = ["apt-get", "update"]
+    if len(sources_list_files) == 1:
+        cmd += [
+            "-o",
+            "Dir::Etc::sourcelist={}".format(sources_list_files[0]),
+            "-o",
+            "Dir::Etc::sourceparts=-",
+            "-o",
+            "APT::Get::List-Cleanup=0",
+        ]
+    logging.info("Updating apt cache...")
     neatly_run_command(cmd)
 
 
@@ -217,10 +261,25 @@ def main() -> None:
     parser.add_argument("login", help="The login to use for the PPA.")
     parser.add_argument("password", help="The password to use for the PPA.")
     parser.add_argument("key", help="PPA's key to add.")
+    parser.add_argument(
+        "--extra-ppa",
+        nargs=4,
+        action="append",
+        default=[],
+        metavar=("PPA", "LOGIN", "PASSWORD", "KEY"),
+        help="Another PPA to add (can be used multiple times).",
+    )
     args = parser.parse_args()
-    create_apt_auth_file(args.ppa, args.login, args.password)
-    add_ppa_key(args.key)
-    add_ppa_to_sources_list(args.ppa)
+    ppas = [(args.ppa, args.login, args.password, args.key)] + [
+        tuple(extra) for extra in args.extra_ppa
+    ]
+    # keys go first, so a failure there doesn't leave unsigned sources behind
+    add_ppa_keys([key for _ppa, _login, _password, key in ppas])
+    sources_list_files = []
+    for ppa, login, password, _key in ppas:
+        create_apt_auth_file(ppa, login, password)
+        sources_list_files.append(add_ppa_to_sources_list(ppa))
+    update_apt_cache(sources_list_files)
 
 
 if __name__ == "__main__":
@@ -4,41 +4,60 @@ import datetime
 import json
 import os
 import re
-import subprocess
 
+import pandas as pd
+import requests
 from influxdb import InfluxDBClient
+from requests.adapters import HTTPAdapter
 
 
 INFLUX_HOST = "10.50.124.12"
 
+URL_TRIGGER_RE = re.compile("The value for the JSON Path '(.*?)' has changed.")
+JOB_NAME_RE = re.compile(r'advocacy-(\w+)-(\w+)-gfx')
+
 
 client = InfluxDBClient(
     INFLUX_HOST, 8086, 'ce', os.environ.get("INFLUX_PASS"), 'desktopsnaps')
 
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=4))
+session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
 
 class CurlError(Exception):
     pass
 
 
 def curl(url):
-    cmd = ['curl', '-s', url]
     try:
-        out = subprocess.check_output(cmd)
-        return out.decode('utf-8')
-    except subprocess.CalledProcessError:
+        r = session.get(url, timeout=30)
+        r.raise_for_status()
+        return r.text
+    except requests.RequestException:
         raise CurlError
 
 
-def set_cause_version_from_manifest(cause, manifest):
-    match = re.search(fr'^{cause}(?::\w+)?\s+([^\n]+)', manifest, re.MULTILINE)
+def manifest_pattern(cause):
+    return re.compile(
+        fr'^{re.escape(cause)}(?::\w+)?\s+([^\n]+)', re.MULTILINE)
+
+
+def snap_list_pattern(cause):
+    return re.compile(
+        fr'^{re.escape(cause)}\s+(\S+)\s+(\S+)\s+', re.MULTILINE)
+
+
+def set_cause_version_from_manifest(pattern, manifest):
+    match = pattern.search(manifest)
     if match:
         return match.group(1).rstrip()
     else:
         return 'N/A'
 
 
-def set_cause_version_from_snap_list(cause, snap_list):
-    match = re.search(fr'^{cause}\s+(\S+)\s+(\S+)\s+', snap_list, re.MULTILINE)
+def set_cause_version_from_snap_list(pattern, snap_list):
+    match = pattern.search(snap_list)
     if match:
         return f"{match.group(1)} ({match.group(2)})"
     else:
@@ -48,14 +67,15 @@ def set_cause_version_from_snap_list(cause, snap_list):
 def main():
     build_url = os.getenv("BUILD_URL")
     print("BUILD_URL:", build_url)
-    csv = ""
     try:
-        with open("artifacts/checkbox.csv") as f:
-            csv = f.read()
-    except OSError:
+        df = pd.read_csv(
+            "artifacts/checkbox.csv", dtype={'snap': str},
+            on_bad_lines='skip')
+    except (OSError, pd.errors.EmptyDataError):
         print('Unable to read CSV results.')
-    print("CSV:", csv)
-    if 'snap,cold,hot' not in csv:
+        df = pd.DataFrame()
+    print("CSV:", df.to_csv(index=False))
+    if not {'snap', 'cold', 'hot'} <= set(df.columns):
         raise SystemExit("CSV format unsupported")
 
     url = "{}api/json".format(build_url)
@@ -77,7 +97,7 @@ def main():
             with open("artifacts/snap_list.txt") as f:
                 snap_list = f.read()
                 cause_version = set_cause_version_from_snap_list(
-                    cause, snap_list)
+                    snap_list_pattern(cause), snap_list)
         except OSError:
             snap_list = None
     except KeyError:
@@ -86,8 +106,7 @@ def main():
                 'actions'][1]['causes'][0]['shortDescription']
             if 'URLTrigger' in cause_desc:
                 res = curl("{}triggerCauseAction/".format(build_url))
-                m = re.search(
-                    "The value for the JSON Path '(.*?)' has changed.", res)
+                m = URL_TRIGGER_RE.search(res)
                 cause = m.group(1)
         except (KeyError, IndexError):
             print('failed to get build cause')
@@ -97,60 +116,50 @@ def main():
             with open("artifacts/manifest.txt") as f:
                 deb_manifest = f.read()
                 cause_version = set_cause_version_from_manifest(
-                    cause, deb_manifest)
+                    manifest_pattern(cause), deb_manifest)
         except OSError:
             deb_manifest = None
     ts = build_desc['timestamp']
     date = datetime.datetime.fromtimestamp(ts/1000).strftime(
         '%Y-%m-%dT%H:%M:%SZ')
-    match = re.search(r'advocacy-(\w+)-(\w+)-gfx', os.getenv("JOB_NAME"))
+    match = JOB_NAME_RE.search(os.getenv("JOB_NAME"))
     if match:
         release = match.groups()[0]
         hw_id = match.groups()[1]
     else:
         raise SystemExit("Unable to find release/hw_id data")
 
-    snaps = {line.split(',')[0] for line in csv.splitlines()[1:]}
-    for l in csv.splitlines()[1:]:
-        try:
-            snap, cold, hot = l.split(',')
-            if hot == '-1':
-                hot = 0
-            if cold == '-1':
-                cold = 0
-            try:
-                hot = float(hot)
-            except ValueError:
-                hot = 0.0
-            try:
-                cold = float(cold)
-            except ValueError:
-                cold = 0.0
-            if cold == 0.0 or hot == 0.0:
-                continue
-            measurements = [{
-                "measurement": "startup_time",
-                "tags": {
-                    "hw_id": hw_id,
-                    "release": release,
-                    "snap": snap,
-                    "cause": cause,
-                    "cause_version": cause_version,
-                },
-                "fields": {
-                    "hot": hot,
-                    "cold": cold,
-                    "jenkins": '<a href="{}">Jenkins build</a>'.format(
-                        build_url),
-                },
-                "time": date
-            }]
-            if cause in snaps and cause != snap:
-                continue
-            print("uploading measurements:", measurements)
-            client.write_points(measurements)
-        except ValueError:
-            continue
+    # an empty snap name would otherwise be read as NaN and tagged 'nan'
+    df['snap'] = df['snap'].fillna('')
+    snaps = set(df['snap'])
+    # -1 and unparsable values mean the measurement is not available
+    starts = ['cold', 'hot']
+    df[starts] = df[starts].apply(
+        pd.to_numeric, errors='coerce').fillna(0.0)
+    df = df[((df[starts] != 0.0) & (df[starts] != -1.0)).all(axis=1)]
+    if cause in snaps:
+        df = df[df['snap'] == cause]
+    jenkins = '<a href="{}">Jenkins build</a>'.format(build_url)
+    measurements = [{
+        "measurement": "startup_time",
+        "tags": {
+            "hw_id": hw_id,
+            "release": release,
+            "snap": snap,
+            "cause": cause,
+            "cause_version": cause_version,
+        },
+        "fields": {
+            "hot": float(hot),
+            "cold": float(cold),
+            "jenkins": jenkins,
+        },
+        "time": date
+    } for snap, cold, hot in df[['snap', 'cold', 'hot']].itertuples(
+        index=False)]
+    if measurements:
+        print("uploading measurements:", measurements)
+        client.write_points(measurements, batch_size=5000)
 
 
 if __name__ == '__main__':
@@ -6,10 +6,8 @@
 #        Sylvain Pineau <sylvain.pineau@canonical.com>
 
 import argparse
-import io
 import os
 
-import numpy as np
 import plotly.graph_objects as go
 import pandas as pd
 import requests
@@ -27,47 +25,45 @@ def get_csv(filename=None):
         "q": "SELECT * FROM startup_time"
     }
     a = requests.auth.HTTPBasicAuth('ce', os.getenv("INFLUX_PASS"))
-    r = requests.post(url, headers=h, params=params, auth=a)
-    return io.StringIO(r.text)
+    r = requests.post(url, headers=h, params=params, auth=a, stream=True)
+    r.raise_for_status()
+    # let pandas read the (decompressed) response body as it arrives
+    r.raw.decode_content = True
+    return r.raw
 
 
 def plot(args):
     config = {'displaylogo': False}
     template = "%{y:.2f} s <b>%{customdata[0]} %{customdata[1]}"
-    df = pd.read_csv(
-        get_csv(args.csv),
-        parse_dates={'date': ["time"]},
-        date_parser=lambda time: pd.to_datetime(int(time)))
+    df = pd.read_csv(get_csv(args.csv), dtype={'time': 'int64'})
+    df['date'] = pd.to_datetime(df.pop('time'), unit='ns')
     snaps = sorted(set(df['snap']))
     prefix = "snap_baseline"
     triggers = ['linux-generic', 'snapd', 'core18', 'apparmor', 'libc6']
     if args.os_baseline:
         prefix = "os_baseline"
         triggers = snaps
-    ymax = df[
-        (df["hw_id"] == args.hw_id) & (df["cause"].isin(triggers))
-        ]["cold"].max()
-    include_js = True
+    base = df[(df["hw_id"] == args.hw_id) & (df["cause"].isin(triggers))]
+    ymax = base["cold"].max()
+    by_snap = dict(tuple(base.groupby('snap')))
+    # plotly.js is loaded from the CDN by the first figure only
+    include_js = 'cdn'
 
     with open(f'{args.folder}/{prefix}_{args.hw_id}.html', 'w') as f:
         for snap in snaps:
-            data = df[
-                (df["snap"] == snap) & (df["hw_id"] == args.hw_id) &
-                (df["cause"].isin(triggers))]
-            releases = sorted(set(data['release']))
+            data = by_snap.get(snap, base.iloc[:0])
+            releases = dict(tuple(data.groupby('release', sort=True)))
             fig = go.Figure(layout_title_text=f"<b>{snap}")
             # Create traces
             for start in ['cold', 'hot']:
-                for release in releases:
-                    release_data = data[(data["release"] == release)]
+                for release, release_data in releases.items():
                     fig.add_trace(
                         go.Scatter(
                             x=release_data['date'], y=release_data[start],
                             mode='lines+markers',
                             xhoverformat="%Y-%m-%d %H:%M:%S",
-                            customdata=np.stack((
-                                release_data['cause'],
-                                release_data['cause_version']), axis=-1),
+                            customdata=release_data[
+                                ['cause', 'cause_version']].to_numpy(),
                             hovertemplate=template,
                             name='{} start ({})'.format(start, release)))
             fig.update_yaxes(range=[0, ymax+1])
@@ -108,8 +104,7 @@ def plot(args):
             include_js = False
             headers = [f"<b>{snap.capitalize()}<br>startup time"]
             values = [["Mean", "Std Dev", "Last"]]
-            for release in releases:
-                release_data = data[(data["release"] == release)]
+            for release, release_data in releases.items():
                 headers.append(f"<b>{release.capitalize()}<br>Cold / Hot (s)")
                 values.append([
                     f"{release_data['cold'].mean():.2f}"
@@ -1,10 +1,41 @@
-import json
+import atexit
+import logging
 
+import fastjsonschema
+import orjson
 from flask import Flask, request
-from influxdb import InfluxDBClient
+from influxdb_client import InfluxDBClient, WriteOptions
 
 from influx_credentials import credentials
-from pprint import pprint
+
+
+# schema of a list of data points accepted by the InfluxDB Python client;
+# used as a fast path, validate_point() explains what went wrong
+validate_measurements = fastjsonschema.compile({
+    # in draft-04 'integer' doesn't match floats like 42.0, same as
+    # validate_point()
+    '$schema': 'http://json-schema.org/draft-04/schema#',
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'required': ['measurement', 'tags', 'time', 'fields'],
+        'properties': {
+            'measurement': {'type': 'string'},
+            'tags': {'type': 'object'},
+            'time': {'type': ['integer', 'string']},
+            'fields': {'type': 'object'},
+        },
+    },
+})
+
+
+RIGHT_TYPES = {
+    'measurement': [str],
+    'tags': [dict],
+    'time': [int, str],
+    'fields': [dict],
+}
+REQUIRED_FIELDS = frozenset(RIGHT_TYPES)
 
 
 def validate_point(data_point):
@@ -20,12 +51,10 @@ def validate_point(data_point):
     """
     if type(data_point) != dict:
         return ['Data point {} is not a dict'.format(data_point)]
-    RIGHT_TYPES = {
-        'measurement': [str],
-        'tags': [dict],
-        'time': [int, str],
-        'fields': [dict],
-    }
+    if REQUIRED_FIELDS <= data_point.keys() and all(
+            type(data_point[name]) in types
+            for name, types in RIGHT_TYPES.items()):
+        return []
     errors = []
     for name, types in RIGHT_TYPES.items():
         if name not in data_point.keys():
@@ -45,39 +74,49 @@ def create_app(config_name=None):
 
     with app.app_context():
         if config_name == 'testing':
-            class MockDB:
-                def write_points(*args, **kwargs):
-                    return True
-            app.influx_client = MockDB()
+            class MockWriteApi:
+                def write(*args, **kwargs):
+                    pass
+            app.write_api = MockWriteApi()
         else:
-            app.influx_client = InfluxDBClient(
-                credentials['host'], 8086, credentials['user'],
-                credentials['pass'])
+            # InfluxDB 1.8+ compatibility API: token is 'user:password'
+            client = InfluxDBClient(
+                url='http://{}:8086'.format(credentials['host']),
+                token='{}:{}'.format(credentials['user'], credentials['pass']),
+                org='-')
+            # points are queued and flushed in batches by a background thread
+            app.write_api = client.write_api(write_options=WriteOptions(
+                batch_size=1000, flush_interval=1000, jitter_interval=200))
+            atexit.register(client.close)
+            atexit.register(app.write_api.close)
 
     @app.route('/influx', methods=['POST'])
     def influx():
         if request.headers.get('Content-Type') != 'application/json':
             return ('Not json!', 400)
         try:
-            payload = json.loads(request.data.decode('utf-8'))
-            pprint(payload)
+            payload = orjson.loads(request.get_data())
+            if app.logger.isEnabledFor(logging.DEBUG):
+                app.logger.debug('payload=%r', payload)
             if 'database' not in payload.keys():
                 return ('No database specified', 400)
             dbname = payload['database']
             measurements = payload['measurements']
-        except json.decoder.JSONDecodeError as exc:
+        except orjson.JSONDecodeError as exc:
             return ('JSON decode error: {}'.format(exc), 400)
-        err_msgs = []
-        for point in measurements:
-            err_msgs += validate_point(point)
-        if err_msgs:
-            return (', '.join(err_msgs), 400)
         try:
-            query_res = app.influx_client.write_points(
-                measurements, database=dbname)
+            validate_measurements(measurements)
+        except fastjsonschema.JsonSchemaException:
+            err_msgs = []
+            for point in measurements:
+                err_msgs.extend(validate_point(point))
+            if err_msgs:
+                return (', '.join(err_msgs), 400)
+        try:
+            app.write_api.write(bucket=dbname, record=measurements)
         except Exception as exc:
             return ('Failed to write data point: {}'.format(exc), 400)
-        return 'OK' if query_res else ('Failed to write data point', 400)
+        return ('Accepted', 202)
 
     return app
 
@@ -33,7 +33,7 @@ def test_no_measurements(client):
         'database': 'foobar',
         'measurements': []
     })
-    assert(rv.status_code == 200)
+    assert(rv.status_code == 202)
 
 
 def test_bad_item(client):
@@ -59,7 +59,7 @@ def test_good_item(client):
             'fields': dict(),
         }],
         })
-    assert(rv.status_code == 200)
+    assert(rv.status_code == 202)
 
 
 def test_good_and_bad_items(client):
@@ -78,3 +78,37 @@ def test_good_and_bad_items(client):
     assert(b"'tags' field missing" in rv.data)
     assert(b"'fields' field missing" in rv.data)
     assert(b"'measurement' field missing" in rv.data)
+
+
+def test_float_time(client):
+    rv = client.post('/influx', json={
+        'database': 'foobar',
+        'measurements': [{
+            'measurement': 'foobar',
+            'tags': dict(),
+            'time': 42.0,
+            'fields': dict(),
+        }],
+    })
+    assert(rv.status_code == 400)
+    assert(b"'time' is not a type of" in rv.data)
+
+
+def test_validate_point_good_item():
+    assert(influx.validate_point({
+        'measurement': 'foobar',
+        'tags': dict(),
+        'time': 42,
+        'fields': dict(),
+    }) == [])
+
+
+def test_validate_point_wrong_type():
+    errors = influx.validate_point({
+        'measurement': 'foobar',
+        'tags': dict(),
+        'time': 4.2,
+        'fields': dict(),
+    })
+    assert(len(errors) == 1)
+    assert("'time' is not a type of" in errors[0])
@@ -7,6 +7,6 @@ export LC_ALL=C.UTF-8
 killall openvpn gunicorn
 openvpn --config /vpn/client.ovpn --auth-nocache --daemon vpn-daemon
 cd app
-gunicorn --bind 0.0.0.0 influx:app
+gunicorn --bind 0.0.0.0 --workers 4 --worker-class gthread --threads 8 --keep-alive 30 influx:app
 
 EOF
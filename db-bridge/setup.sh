@@ -13,7 +13,7 @@ timeout 20 bash -c "while ! ping -c 1 archive.ubuntu.com > /dev/null 2>&1; do sl
 
 apt update
 apt install -yqq openvpn python3-pip
-pip3 install Flask gunicorn influxdb
+pip3 install Flask gunicorn influxdb-client orjson fastjsonschema
 cp -r /vpn .
 cp -r /app .
 EOF
@@ -8,6 +8,15 @@ import requests
 import sys
 import yaml
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 parser = ArgumentParser()
 parser.add_argument("--config", "-c", required=True,
@@ -27,13 +36,31 @@ snap:
                 version
                 revision
 """
-mysnapdict = dict()
-for snap, store in SNAPS:
+session = requests.Session()
+session.headers.update({"Snap-Device-Series": "16"})
+adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32,
+                      max_retries=Retry(total=3, backoff_factor=0.3))
+session.mount("https://", adapter)
+
+
+def fetch(snap, store):
+    """Fetch the store info for a single snap, reusing pooled connections."""
     url = "https://api.snapcraft.io/v2/snaps/info/{}?fields=version,revision,snap-yaml".format(snap)
-    headers = {"Snap-Device-Series": "16",
-               "Snap-Device-Store": store}
-    a = requests.get(url, headers=headers)
-    j = a.json()
+    a = session.get(url, headers={"Snap-Device-Store": store})
+    return a.json()
+
+
+@lru_cache(maxsize=None)
+def parse_snap_yaml(snap_yaml):
+    """Parse snap.yaml; the same one is usually shared by many channels."""
+    return yaml.load(snap_yaml, Loader=SafeLoader)
+
+
+with ThreadPoolExecutor(max_workers=16) as ex:
+    results = list(ex.map(lambda p: fetch(*p), SNAPS))
+
+mysnapdict = dict()
+for (snap, store), j in zip(SNAPS, results):
     if not hasattr(mysnapdict, snap):
         mysnapdict[snap] = dict()
     if "channel-map" not in j:
@@ -46,7 +73,7 @@ for snap, store in SNAPS:
         revision = x["revision"]
         snap_yaml = x.get("snap-yaml")
         if snap_yaml:
-            snap_dict = yaml.safe_load(snap_yaml)
+            snap_dict = parse_snap_yaml(snap_yaml)
             grade = snap_dict.get("grade")
         else:
             grade = "unknown"
@@ -22,18 +22,43 @@ This program computes KPIs of Customer Engineering projects
 and posts measurements to the InfluxDB via Taipei Lab DB-bridge
 """
 
+import json
+import os
+import re
 import time
 
+from argparse import ArgumentParser
 from pprint import pprint
 
 import pygsheets
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+SESSION = requests.Session()
+SESSION.mount('http://', HTTPAdapter(
+    pool_maxsize=32, max_retries=Retry(total=3, backoff_factor=0.2)))
+SESSION.mount('https://', HTTPAdapter(
+    pool_maxsize=32, max_retries=Retry(total=3, backoff_factor=0.2)))
+
+# everything that cannot be a part of a number
+NOT_NUMBER_RE = re.compile(r'[^0-9.\-]')
+
+# (lowercased) labels of the KPIs sheet rows summarizing each LOB
+OVERALL_ROWS = frozenset(['iot overall', 'store overall', 'pc overall'])
 
 
 def optional_int(string):
     """
     Try "extracting" integer from a string.
+    Whole numbers (unformatted cell values) are taken as they are,
+    fractional ones are rejected just like '41.6' is.
     Returns extracted integer or None if string couldn't be parsed.
+    >>> optional_int(42)
+    42
+    >>> optional_int(42.0)
+    42
+    >>> optional_int(41.6)
     >>> optional_int('42')
     42
     >>> optional_int('-42')
@@ -44,6 +69,8 @@ def optional_int(string):
     >>> optional_int('-')
     >>> optional_int('two')
     """
+    if isinstance(string, (int, float)):
+        return int(string) if float(string).is_integer() else None
     try:
         return int(string)
     except ValueError:
@@ -53,8 +80,13 @@ def optional_int(string):
 def optional_percent(string):
     """
     Try "extracting" a percentage from a string.
+    Numbers (unformatted cell values) are taken as fractions, so a
+    plain 0.425 counts as 42.5% even if the cell isn't formatted as a
+    percentage (such a cell used to be rejected as text).
     Returns a real number or None
     if string couldn't be parsed.
+    >>> optional_percent(0.425)
+    0.425
     >>> optional_percent('42.5%')
     0.425
     >>> optional_percent('1%')
@@ -65,12 +97,14 @@ def optional_percent(string):
     >>> optional_percent('seven percent')
     >>> optional_percent('N/A')
     """
+    if isinstance(string, (int, float)):
+        return float(string)
+    if not string.endswith('%'):
+        return None
     try:
-        if string[-1] != '%':
-            return None
         # drop '%' suffix and divide by 100
         return float(string[:-1]) / 100.0
-    except (ValueError, IndexError):
+    except ValueError:
         return None
 
 
@@ -94,26 +128,47 @@ def currency(string):
     >>> currency('$-80.01')
     -80.01
     """
-    filtered = ''
-    for char in string:
-        if char in '0123456789-.':
-            filtered += char
     try:
-        return float(filtered)
-    except (ValueError, IndexError):
+        return float(NOT_NUMBER_RE.sub('', string))
+    except ValueError:
         return None
 
 
-def get_prebaked_kpis():
+def get_prebaked_kpis(use_cache=True):
+    """
+    Get the KPIs from the KPIs worksheet.
+
+    The parsed KPIs are cached on disk together with the spreadsheet's
+    modification time, so the worksheet is only fetched again when it has
+    changed since the last run.
+    """
     sheet_id = '11cbEwUsOCuv5Hs5RRh1VZZccZ-PDwA8rDdzbiyRkmUw'
     gcli = pygsheets.authorize()
     sheet = gcli.open_by_key(sheet_id)
+    updated = sheet.updated
+    cache_dir = os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+        'ce_proj_kpis')
+    cache_path = os.path.join(cache_dir, '{}.json'.format(sheet_id))
+    if use_cache:
+        try:
+            with open(cache_path, 'rt') as cache_file:
+                cache = json.load(cache_file)
+            if cache['updated'] == updated:
+                return cache['kpis']
+        except (OSError, ValueError, KeyError):
+            pass
     wsheet = sheet.worksheet_by_title('KPIs')
-    all_vals = wsheet.get_all_values()
+    # only the label and the five KPI columns are used; unformatted values
+    # come as numbers, so they don't need to be parsed from display strings
+    all_vals = wsheet.get_values(
+        'A1', (wsheet.rows, 6),
+        value_render=pygsheets.ValueRenderOption.UNFORMATTED_VALUE)
     kpis = dict()
     for row_num, row in enumerate(all_vals, start=1):
-        if row[0].lower() in ['iot overall', 'store overall', 'pc overall']:
-            lob = row[0].split(' ')[0].lower()
+        label = str(row[0]).lower()
+        if label in OVERALL_ROWS:
+            lob = label.split(' ')[0]
             kpis['avg_{}_time_to_market'.format(lob)] = (
                     optional_int(row[1]) or 0)
             kpis['avg_{}_budget_variance'.format(lob)] = (
@@ -124,22 +179,33 @@ def get_prebaked_kpis():
                     optional_int(row[4]) or 0)
             kpis['avg_{}_roi'.format(lob)] = (
                     optional_percent(row[5]) or 0)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    with open(tmp_path, 'wt') as cache_file:
+        json.dump({'updated': updated, 'kpis': kpis}, cache_file)
+    os.replace(tmp_path, cache_path)
     return kpis
 
 
 def main():
     """Get stats and post measurements."""
-    kpis = get_prebaked_kpis()
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help="Always fetch the KPIs from the spreadsheet")
+    args = parser.parse_args()
+    kpis = get_prebaked_kpis(use_cache=not args.no_cache)
     print('Posting measuremens:')
     pprint(kpis)
 
     reqobj = {'database': 'certsandbox', 'measurements': [{
         'measurement': 'project_kpis',
-        'time': int(time.time() * 10 ** 9),  # sec to nsec
+        'time': time.time_ns(),
         'tags': {},
         'fields': kpis,
     }]}
-    response = requests.post('http://10.101.51.246:8000/influx', json=reqobj)
+    response = SESSION.post(
+        'http://10.101.51.246:8000/influx', json=reqobj)
     if not response.ok:
         raise SystemExit('Failed to post measurements:\n{}'.format(
             response.text))
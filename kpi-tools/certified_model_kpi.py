@@ -22,55 +22,67 @@ import os
 import requests
 import sys
 
+from datetime import datetime
 from influxdb import InfluxDBClient
 from dateutil import parser
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 INFLUX_HOST = "10.50.124.12"
+NSEC = 1_000_000_000
+
+SESSION = requests.Session()
+SESSION.mount('http://', HTTPAdapter(
+    pool_maxsize=32, max_retries=Retry(total=3, backoff_factor=0.2)))
+SESSION.mount('https://', HTTPAdapter(
+    pool_maxsize=32, max_retries=Retry(total=3, backoff_factor=0.2)))
 
 
 def init_influx():
     '''Init influxdb with policy'''
     dbname = "pre-certs-report"
+    # writes go over UDP if the port is set (the UDP listener on the server
+    # has to be configured to write to the dbname database)
+    udp_port = os.environ.get("INFLUX_UDP_PORT")
     client = InfluxDBClient(INFLUX_HOST, 8086,
-                            "ce", os.environ.get("INFLUX_PASS"), dbname)
+                            "ce", os.environ.get("INFLUX_PASS"), dbname,
+                            use_udp=bool(udp_port),
+                            udp_port=int(udp_port or 4444))
     dbs = client.get_list_database()
     if {u"name": dbname} not in dbs:
         client.create_database(dbname)
         client.create_retention_policy("default_policy",
                                        "350w", 1, default=True)
+    return client
 
 
-def push_influx_generic(measurement, tags, time, fields):
-    '''Generic influx measurement pusher'''
-    dbname = "pre-certs-report"
-    client = InfluxDBClient(INFLUX_HOST, 8086,
-                            "ce", os.environ.get("INFLUX_PASS"), dbname)
+def parse_completed(completed):
+    """
+    Parse the completion date of a certificate (as a naive datetime).
 
-    body = [
-        {
-            "measurement": measurement,
-            "tags": tags,
-            "time": time,
-            "fields": fields
-        }
-    ]
-    client.write_points(body)
-    print("Measurement pushed to influx at {}".format(time))
+    The API returns ISO 8601 dates, so the fast fromisoformat is tried first.
+    """
+    try:
+        date = datetime.fromisoformat(completed.replace('Z', '+00:00'))
+    except ValueError:
+        date = parser.parse(completed)
+    return date.replace(tzinfo=None)
 
 
 def main():
     print("Initialize influx")
-    init_influx()
+    client = init_influx()
     print("Influx initialized")
     # request a report of all the certificates issued
     url = "https://certification.canonical.com/api/v1/certifiedmodeldetails/report/?format=json"
-    r = requests.get(url)
+    r = SESSION.get(url)
     if not r.ok:
         raise SystemExit("Unable to access report. HTTP {}".format(r.status_code))
     report = r.json()
     measure = 'pre-certs-report'
 
+    points = []
     for cert in report["certificates"]:
         tags = dict()
         fields = dict()
@@ -93,9 +105,19 @@ def main():
         fields['make'] = cert['make']
         fields['certified_release'] = cert['certified_release']
         fields['certified'] = 1
-        completed_date = parser.parse(cert["completed"]).replace(tzinfo=None)
-        ts = completed_date.timestamp() * 10 ** 9
-        push_influx_generic(measure, tags, int(ts), fields)
+        completed_date = parse_completed(cert["completed"])
+        ts = (int(completed_date.timestamp()) * NSEC +
+              completed_date.microsecond * 1000)
+        points.append({
+            "measurement": measure,
+            "tags": tags,
+            "time": ts,
+            "fields": fields
+        })
+    # keep UDP datagrams well below the maximum packet size
+    udp = bool(os.environ.get("INFLUX_UDP_PORT"))
+    client.write_points(points, batch_size=100 if udp else 5000)
+    print("{} measurements pushed to influx".format(len(points)))
 
 
 if __name__ == "__main__":
@@ -24,11 +24,17 @@ import requests
 import time
 import os
 
+from concurrent.futures import ThreadPoolExecutor
 from dateutil import parser
 from influxdb import InfluxDBClient
 from trello import TrelloClient
 
 INFLUX_HOST = "10.50.124.12"
+NSEC = 1_000_000_000
+
+CARD_RE = re.compile(
+    r"(?P<snap>.*?)(?:\s+\-\s+)(?P<version>.*?)(?:\s+\-\s+)"
+    r"\((?P<revision>.*?)\)(?:\s+\-\s+\[(?P<track>.*?)\])?")
 
 
 def environ_or_required(key):
@@ -49,26 +55,10 @@ def init_influx():
         client.create_database(dbname)
         client.create_retention_policy("default_policy",
                                        "350w", 1, default=True)
+    return client
 
 
-def push_influx_generic(measurement, tags, time, fields):
-    '''Generic influx measurement pusher'''
-    dbname = "candidatesnapsfail"
-    client = InfluxDBClient(INFLUX_HOST, 8086,
-                            "ce", os.environ.get("INFLUX_PASS"), dbname)
-    body = [
-        {
-            "measurement": measurement,
-            "tags": tags,
-            "time": time,
-            "fields": fields
-        }
-    ]
-    client.write_points(body)
-    print("measurement: %s at: %s pushed to influx", measurement, str(time))
-
-
-def influx_push(snap, whenmoved, revno, version):
+def influx_point(snap, whenmoved, revno, version):
     tags = dict()
     fields = dict()
     tags['snap'] = snap
@@ -77,12 +67,35 @@ def influx_push(snap, whenmoved, revno, version):
     fields['FAILED'] = 1
     measure = 'minusone'
     print(version)
-    push_influx_generic(measure, tags, whenmoved, fields)
+    return {
+        "measurement": measure,
+        "tags": tags,
+        "time": whenmoved,
+        "fields": fields
+    }
+
+
+def process_card(card):
+    """
+    Build a measurement point for a card of a failed snap.
+
+    Returns None if the card is not marked as FAILED.
+    """
+    m = CARD_RE.match(card.name)
+    if not m:
+        return None
+    if "FAILED" not in {label.name for label in card.labels}:
+        return None
+    when = card.dateLastActivity
+    d = int(when.timestamp()) * NSEC + when.microsecond * 1000
+    return influx_point(
+        card.name.split(' ')[0], d,
+        m.group('revision'), m.group('version'))
 
 
 def main():
     print("Initialize influx")
-    init_influx()
+    influx_client = init_influx()
     print("Influx initialized")
     parser = argparse.ArgumentParser()
     parser.add_argument('--key', help="Trello API key",
@@ -95,15 +108,10 @@ def main():
     client = TrelloClient(api_key=args.key, token=args.token)
     board = client.get_board(args.board)
     all_cards = board.get_cards(card_filter="open")
-    for c in all_cards:
-        m = re.match(
-            r"(?P<snap>.*?)(?:\s+\-\s+)(?P<version>.*?)(?:\s+\-\s+)"
-            r"\((?P<revision>.*?)\)(?:\s+\-\s+\[(?P<track>.*?)\])?", c.name)
-        for label in c.labels:
-            if label.name == "FAILED":
-                d = c.dateLastActivity.timestamp() * 10 ** 9
-                influx_push(c.name.split(' ')[0], int(d),
-                     m.group('revision'), m.group('version'))
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        points = [p for p in executor.map(process_card, all_cards) if p]
+    influx_client.write_points(points, batch_size=5000)
+    print("{} measurements pushed to influx".format(len(points)))
 
 
 if __name__ == "__main__":
@@ -18,27 +18,53 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
+import calendar
+import glob
 from launchpadlib.launchpad import Launchpad
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date, datetime, timedelta
 import json
+import orjson
 import pytz
+import re
 import requests
+import threading
 import time
 import os
 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 ALL_STATUSES = [
     "Fix Committed", "Invalid", "Won't Fix", "Confirmed", "Triaged", "Expired",
     "In Progress", "Incomplete", "Fix Released", "New", "Opinion",
 ]
 
+# number of a repeated dump, e.g. 'proj-name-2019-01-01(3).json'
+DUMP_NUMBER_RE = re.compile(r'\((\d+)\)\.json$')
+
+NSEC = 1_000_000_000
+
+# where results of processing unchanged bugs are kept between the runs
+CACHE_DIR = os.path.join('.cache', 'harvest')
+
+
+def day_to_ns(day):
+    """Get the timestamp (in ns) of the UTC midnight starting the day."""
+    return calendar.timegm(day.timetuple()) * NSEC
+
 
 class StatHarvester:
     def __init__(self, project):
         self.proj = project
-        self.changes = defaultdict(lambda: {key: 0 for key in ALL_STATUSES})
+        self.changes = defaultdict(lambda: defaultdict(int))
         self.till_fixed = []
         self.till_released = []
+        # bugs are processed by multiple threads, results are merged under
+        # the lock
+        self._lock = threading.Lock()
+        self._local = threading.local()
         last_stats = self.load_last_stats()
         self.since = last_stats['date'] + timedelta(seconds=1)
         self.bugs_timeline = {
@@ -59,23 +85,28 @@ class StatHarvester:
             print("Stats already harvested for up to yesterday")
             raise SystemExit()
 
-        launchpad = Launchpad.login_with(
-            'stats-harvester', 'production', credentials_file='./lp_credentials')
+        launchpad = self._launchpad()
         print("Searching for '{}' bugs modified since {}".format(
             self.proj, self.since))
         modified_bugs = launchpad.projects[self.proj].searchTasks(
             status=ALL_STATUSES, modified_since=self.since)
+        task_links = [bug.self_link for bug in modified_bugs]
         time_left_str = 'unknown'
         start_time = time.time()
-        for i, bug in enumerate(modified_bugs, 1):
-            print('Processing bug {}/{}. Estimated time to complete {}'.format(
-                i, len(modified_bugs), time_left_str))
-            self._process_bug(bug)
-            cur_time = time.time()
-            estimated_total = (cur_time - start_time) * len(modified_bugs) / i
-            estimated_time_left = max(
-                0, start_time + estimated_total - cur_time)
-            time_left_str = '{:.2f}s'.format(estimated_time_left)
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            futures = [
+                executor.submit(self._process_bug_link, link)
+                for link in task_links]
+            for i, future in enumerate(as_completed(futures), 1):
+                future.result()
+                cur_time = time.time()
+                estimated_total = (cur_time - start_time) * len(futures) / i
+                estimated_time_left = max(
+                    0, start_time + estimated_total - cur_time)
+                time_left_str = '{:.2f}s'.format(estimated_time_left)
+                print('Processed bug {}/{}. Estimated time to complete {}'.format(
+                    i, len(futures), time_left_str))
+        self._prune_cache()
         self.generate_timeline()
 
     def generate_timeline(self):
@@ -84,12 +115,17 @@ class StatHarvester:
             date_cursor - timedelta(days=1),
             {key: 0 for key in ALL_STATUSES}
         )
+        no_changes = {}
         while date_cursor < date.today():
-            self.bugs_timeline[date_cursor] = previous_stats.copy()
-            for key in ALL_STATUSES:
-                self.bugs_timeline[date_cursor][key] += (
-                    self.changes[date_cursor][key])
-            previous_stats = self.bugs_timeline[date_cursor]
+            stats = dict(previous_stats)
+            # most of the days see no, or just a few status changes
+            day_changes = self.changes.get(date_cursor, no_changes)
+            for key, delta in day_changes.items():
+                # LP knows more statuses than the ones being tracked
+                if key in stats:
+                    stats[key] += delta
+            self.bugs_timeline[date_cursor] = stats
+            previous_stats = stats
             date_cursor += timedelta(1)
 
     def generate_records(self):
@@ -108,9 +144,10 @@ class StatHarvester:
             "Expired": 'expired',
         }
         for date_ in sorted(self.bugs_timeline):
+            ts_ns = day_to_ns(date_)
             for status in sorted(self.bugs_timeline[date_]):
                 result = {
-                    'time': int(date_.strftime('%s')) * 10 ** 9,
+                    'time': ts_ns,
                     'status': influx_friendly_statuses[status],
                     'count': self.bugs_timeline[date_][status],
                 }
@@ -118,12 +155,15 @@ class StatHarvester:
         return results
 
     def dump_json(self):
-        with open(self._generate_filename('time_till_fixed'), 'wt') as f:
-            json.dump(self.till_fixed, f, indent=2)
-        with open(self._generate_filename('time_till_released'), 'wt') as f:
-            json.dump(self.till_released, f, indent=2)
-        with open(self._generate_filename('bugs_statistics'), 'wt') as f:
-            json.dump(self.generate_records(), f, indent=2)
+        with self._open_dump_file('time_till_fixed') as f:
+            f.write(orjson.dumps(
+                self.till_fixed, option=orjson.OPT_INDENT_2))
+        with self._open_dump_file('time_till_released') as f:
+            f.write(orjson.dumps(
+                self.till_released, option=orjson.OPT_INDENT_2))
+        with self._open_dump_file('bugs_statistics') as f:
+            f.write(orjson.dumps(
+                self.generate_records(), option=orjson.OPT_INDENT_2))
 
     def dump_sql(self):
         for res in self.generate_records():
@@ -181,14 +221,18 @@ class StatHarvester:
         bork_url = 'http://{}/influx'.format(bork_addr)
         # infrastructure can choke on too big bundle of records,
         # so let's chop it into 1000-record-long chunks
+        session = requests.Session()
+        session.mount('http://', HTTPAdapter(
+            pool_connections=1, pool_maxsize=1,
+            max_retries=Retry(total=3, backoff_factor=0.3)))
         while measurements:
             chunk = measurements[:1000]
-            measurements = measurements[100:]
+            measurements = measurements[1000:]
             request = {
                 'database': db_name,
                 'measurements': chunk,
             }
-            response = requests.post(bork_url, json=request)
+            response = session.post(bork_url, json=request)
             if not response:
                 print("Couldn't push measurements:\n{}: {}".format(
                     response, response.text))
@@ -216,21 +260,118 @@ class StatHarvester:
                 'stats': {key: 0 for key in ALL_STATUSES},
             }
 
-    def _generate_filename(self, name):
-        basename = '{}-{}-{}'.format(
+    def _open_dump_file(self, name):
+        """Create a new dump file that doesn't overwrite any previous one."""
+        basename = '{}-{}-{}-{}'.format(
             self.proj, name, datetime.today().strftime("%Y-%m-%d"),
             self.until.strftime("%Y-%m-%d"))
         possible_name = basename + '.json'
-        if os.path.exists(possible_name):
-            for i in range(1, 1000):
-                possible_name = '{}({}).json'.format(basename, i)
-                if not os.path.exists(possible_name):
-                    return possible_name
-        else:
-            return possible_name
-        raise SystemExit("There's too many dumps from today!")
+        while True:
+            try:
+                fd = os.open(
+                    possible_name, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+                return os.fdopen(fd, 'wb')
+            except FileExistsError:
+                pass
+            # number the dump one past the highest numbered one
+            numbers = [
+                int(match.group(1)) for match in (
+                    DUMP_NUMBER_RE.search(path)
+                    for path in glob.glob(glob.escape(basename) + '(*).json'))
+                if match]
+            possible_name = '{}({}).json'.format(
+                basename, max(numbers, default=0) + 1)
+
+    def _launchpad(self):
+        """Get the Launchpad session of the current thread."""
+        # launchpadlib objects are not thread-safe, so each thread has its own
+        launchpad = getattr(self._local, 'launchpad', None)
+        if launchpad is None:
+            launchpad = Launchpad.login_with(
+                'stats-harvester', 'production',
+                credentials_file='./lp_credentials')
+            self._local.launchpad = launchpad
+        return launchpad
+
+    def _process_bug_link(self, link):
+        self._process_bug(self._launchpad().load(link))
+
+    def _fetch_activity(self, bug):
+        """
+        Fetch the whole activity log of a bug (as plain dicts).
+
+        The log is requested straight from the web service in big pages, so
+        long logs don't need a round trip per every 75 entries.
+        """
+        launchpad = self._launchpad()
+        url = '{}/activity?ws.size=300'.format(bug.bug_link)
+        entries = []
+        while url:
+            page = json.loads(launchpad._browser.get(url))
+            entries.extend(page['entries'])
+            url = page.get('next_collection_link')
+        return entries
+
+    def _cache_path(self, bug):
+        """Get the path of the cached results of processing the bug."""
+        # results depend on the harvested period as well as on the bug itself
+        fingerprint = (
+            bug.bug.id, bug.bug.date_last_updated, self.since, self.until)
+        name = '-'.join(
+            str(calendar.timegm(part.utctimetuple()))
+            if isinstance(part, datetime) else str(part)
+            for part in fingerprint)
+        return os.path.join(CACHE_DIR, name + '.json')
+
+    def _prune_cache(self):
+        """Remove the cached results of periods other than this one."""
+        suffix = '-{}-{}.json'.format(
+            calendar.timegm(self.since.utctimetuple()),
+            calendar.timegm(self.until.utctimetuple()))
+        try:
+            names = os.listdir(CACHE_DIR)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith(suffix):
+                os.remove(os.path.join(CACHE_DIR, name))
 
     def _process_bug(self, bug):
+        cache_path = self._cache_path(bug)
+        try:
+            with open(cache_path, 'rt') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            changes, till_fixed, till_released = (
+                self._compute_contribution(bug))
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # write to a temporary file first, so an interrupted run doesn't
+            # leave a broken cache entry behind
+            tmp_path = '{}.{}.tmp'.format(cache_path, threading.get_ident())
+            with open(tmp_path, 'wt') as f:
+                json.dump({
+                    'changes': [
+                        (date_.isoformat(), status, delta)
+                        for date_, status, delta in changes],
+                    'till_fixed': till_fixed,
+                    'till_released': till_released,
+                }, f)
+            os.replace(tmp_path, cache_path)
+        else:
+            changes = [
+                (date.fromisoformat(date_), status, delta)
+                for date_, status, delta in cached['changes']]
+            till_fixed = cached['till_fixed']
+            till_released = cached['till_released']
+        self._record(changes, till_fixed, till_released)
+
+    def _compute_contribution(self, bug):
+        """
+        Process the activity log of a bug.
+
+        Returns a tuple of the status changes (as (date, status, delta)
+        tuples) and the time-till-fixed and time-till-released records.
+        """
         bug_date = bug.date_created.date()
         # bugs can be filed with any given status, so we cannot just write down
         # 'New' += 1
@@ -238,28 +379,32 @@ class StatHarvester:
         # that the bug was filed with a different one, let's correct that on
         # the first status change encounter
         seen_first_change = False
-        for act in bug.bug.activity:
-            if act.whatchanged == '{}: status'.format(self.proj):
+        changes = []
+        till_fixed = []
+        till_released = []
+        status_change = '{}: status'.format(self.proj)
+        for act in self._fetch_activity(bug):
+            if act['whatchanged'] == status_change:
                 if not seen_first_change:
-                    born_status = act.oldvalue
+                    born_status = act['oldvalue']
                     seen_first_change = True
+                datechanged = datetime.fromisoformat(act['datechanged'])
                 if (
-                    act.datechanged < self.since or
-                    act.datechanged > self.until
+                    datechanged < self.since or
+                    datechanged > self.until
                 ):
                     continue
-                date = act.datechanged.date()
-                self.changes[date][act.oldvalue] -= 1
-                self.changes[date][act.newvalue] += 1
+                date = datechanged.date()
+                changes.append((date, act['oldvalue'], -1))
+                changes.append((date, act['newvalue'], 1))
         # find time to it took from confirmed to fixed
         if bug.date_fix_committed:
             date_confirmed = (
                 bug.date_confirmed or bug.date_triaged or bug.date_created)
             ttfc = bug.date_fix_committed - date_confirmed
-            self.till_fixed.append({
+            till_fixed.append({
                 'hours': ttfc.total_seconds() // 3600,
-                'time': int(
-                    bug.date_fix_committed.date().strftime('%s')) * 10 ** 9,
+                'time': day_to_ns(bug.date_fix_committed.date()),
                 'project': self.proj,
                 'id': bug.bug.id,
                 'tags': ' '.join(bug.bug.tags),
@@ -268,10 +413,9 @@ class StatHarvester:
             date_confirmed = (
                 bug.date_confirmed or bug.date_triaged or bug.date_created)
             ttfr = bug.date_fix_released - date_confirmed
-            self.till_released.append({
+            till_released.append({
                 'hours': ttfr.total_seconds() // 3600,
-                'time': int(
-                    bug.date_fix_released.date().strftime('%s')) * 10 ** 9,
+                'time': day_to_ns(bug.date_fix_released.date()),
                 'project': self.proj,
                 'id': bug.bug.id,
                 'tags': ' '.join(bug.bug.tags),
@@ -282,7 +426,16 @@ class StatHarvester:
             born_status = bug.status
         # now we know the real status the bug was filed with, let's write it
         # down
-        self.changes[bug_date][born_status] += 1
+        changes.append((bug_date, born_status, 1))
+        return changes, till_fixed, till_released
+
+    def _record(self, changes, till_fixed, till_released):
+        """Merge results of processing one bug into the harvested data."""
+        with self._lock:
+            for date_, status, delta in changes:
+                self.changes[date_][status] += delta
+            self.till_fixed.extend(till_fixed)
+            self.till_released.extend(till_released)
 
 
 def main():
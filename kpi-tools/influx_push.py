@@ -19,15 +19,12 @@
 
 """Push measurements stored in JSON file to InfluxDB."""
 
-import json
+import ijson
 
 from argparse import ArgumentParser
 from influxdb import InfluxDBClient
 
-
-def isanyinstance(obj, types):
-    """Check if `obj` is an instance of any of the `types`."""
-    return any([isinstance(obj, t) for t in types])
+BATCH_SIZE = 5000
 
 
 def validate_point(data_point):
@@ -44,12 +41,12 @@ def validate_point(data_point):
     if not isinstance(data_point, dict):
         return ['Data point {} is not a dict'.format(data_point)]
     mandatory = {
-        'measurement': [str],
-        'fields': [dict],
+        'measurement': (str,),
+        'fields': (dict,),
     }
     optional = {
-        'tags': [dict],
-        'time': [int, str],
+        'tags': (dict,),
+        'time': (int, str),
     }
     errors = []
     for name, types in mandatory.items():
@@ -58,13 +55,13 @@ def validate_point(data_point):
                 "Problem with data point: {}. '{}' field missing".format(
                     data_point, name))
             continue
-        if not isanyinstance(data_point[name], types):
+        if not isinstance(data_point[name], types):
             errors.append(
                 "Problem with data point: {}. '{}' is not a type of {}".format(
                     data_point, name, types))
     for name, types in optional.items():
         if name in data_point.keys():
-            if not isanyinstance(data_point[name], types):
+            if not isinstance(data_point[name], types):
                 errors.append(
                     "Problem with data point: {}. "
                     "'{}' is not a type of {}".format(
@@ -72,6 +69,22 @@ def validate_point(data_point):
     return errors
 
 
+def iter_datapoints(measurements_file):
+    """
+    Iterate over data points stored in a JSON file opened in binary mode.
+
+    The file may hold a list of data points or just one data point object.
+    The file is parsed incrementally, so it's never loaded whole to memory.
+    """
+    first = measurements_file.read(1)
+    while first.isspace():
+        first = measurements_file.read(1)
+    measurements_file.seek(0)
+    # if there's only one object we need to listify it
+    prefix = 'item' if first == b'[' else ''
+    return ijson.items(measurements_file, prefix, use_float=True)
+
+
 def main():
     """Entry point."""
     parser = ArgumentParser()
@@ -95,20 +108,27 @@ def main():
     port = 8086 if len(split) == 1 else int(split[1])
     errors = []
     try:
-        with open(args.measurements, 'rt') as measurements_file:
-            data = json.load(measurements_file)
-            # if there's only one object we need to listify it
-            datapoints = data if isinstance(data, list) else [data]
-            for datapoint in datapoints:
+        with open(args.measurements, 'rb') as measurements_file:
+            for datapoint in iter_datapoints(measurements_file):
                 errors += validate_point(datapoint)
-    except json.JSONDecodeError as exc:
+    except ijson.JSONError as exc:
         errors.append('JSON decode error: {}'.format(str(exc)))
     if errors:
         raise SystemExit('\n'.join(errors))
 
+    # everything is valid, so go through the file again, this time pushing
+    # the data points in batches
     try:
         client = InfluxDBClient(host, port, args.username, args.password)
-        client.write_points(datapoints, database=args.database)
+        with open(args.measurements, 'rb') as measurements_file:
+            batch = []
+            for datapoint in iter_datapoints(measurements_file):
+                batch.append(datapoint)
+                if len(batch) == BATCH_SIZE:
+                    client.write_points(batch, database=args.database)
+                    batch = []
+            if batch:
+                client.write_points(batch, database=args.database)
     except Exception as exc:
         raise SystemExit("Problem with pushing the data: {}".format(exc))
 
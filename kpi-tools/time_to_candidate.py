@@ -24,10 +24,18 @@ import requests
 import time
 import os
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from influxdb import InfluxDBClient
 from trello import TrelloClient
 
 INFLUX_HOST = "10.50.124.12"
+DBNAME = "candidatesnaps"
+NSEC = 1_000_000_000
+
+CARD_RE = re.compile(
+    r"(?P<snap>.*?)(?:\s+\-\s+)(?P<version>.*?)(?:\s+\-\s+)"
+    r"\((?P<revision>.*?)\)(?:\s+\-\s+\[(?P<track>.*?)\])?")
 
 
 def environ_or_required(key):
@@ -38,11 +46,17 @@ def environ_or_required(key):
         return {'required': True}
 
 
+@lru_cache(maxsize=None)
+def get_client():
+    '''Get the (shared) influxdb client'''
+    return InfluxDBClient(INFLUX_HOST, 8086,
+                          "ce", os.environ.get("INFLUX_PASS"), DBNAME)
+
+
 def init_influx():
     '''Init influxdb with policy'''
-    dbname = "candidatesnaps"
-    client = InfluxDBClient(INFLUX_HOST, 8086,
-                            "ce", os.environ.get("INFLUX_PASS"), dbname)
+    dbname = DBNAME
+    client = get_client()
     dbs = client.get_list_database()
     if {u"name": dbname} not in dbs:
         client.create_database(dbname)
@@ -50,24 +64,7 @@ def init_influx():
                                        "350w", 1, default=True)
 
 
-def push_influx_generic(measurement, tags, time, fields):
-    '''Generic influx measurement pusher'''
-    dbname = "candidatesnaps"
-    client = InfluxDBClient(INFLUX_HOST, 8086,
-                            "ce", os.environ.get("INFLUX_PASS"), dbname)
-    body = [
-        {
-            "measurement": measurement,
-            "tags": tags,
-            "time": time,
-            "fields": fields
-        }
-    ]
-    client.write_points(body)
-    print("measurement: %s at: %s pushed to influx", measurement, str(time))
-
-
-def influx_push(age, snap, whenmoved, revno, version):
+def influx_point(age, snap, whenmoved, revno, version):
     tags = dict()
     fields = dict()
     tags['snap'] = snap
@@ -75,7 +72,37 @@ def influx_push(age, snap, whenmoved, revno, version):
     tags['version'] = version
     fields['time-to-candidate'] = age
     measure = 'time-to-candidate'
-    push_influx_generic(measure, tags, whenmoved, fields)
+    return {
+        "measurement": measure,
+        "tags": tags,
+        "time": whenmoved,
+        "fields": fields
+    }
+
+
+def process_card(c):
+    """
+    Build measurement points for a card from its Beta -> Candidate moves.
+    Calls list_movements(), one Trello API request per card.
+    """
+    points = []
+    print(c.name)
+    m = CARD_RE.match(c.name)
+    for move in c.list_movements():
+        if(move['destination']['name'] == "Candidate"
+           and move['source']['name'] == 'Beta'):
+            notz = move['datetime'].replace(tzinfo=None)
+            diff = notz - c.card_created_date
+            diff.total_seconds()
+            print(diff.total_seconds)
+            ns = int(notz.timestamp()) * NSEC + notz.microsecond * 1000
+            try:
+                points.append(influx_point(
+                    diff.total_seconds(), c.name.split(' ')[0], ns,
+                    m.group("revision"), m.group("version")))
+            except AttributeError:
+                print("cards with no revision aren't helpful")
+    return points
 
 
 def main():
@@ -94,24 +121,12 @@ def main():
     board = client.get_board(args.board)
     all_cards = board.get_cards(card_filter="open")
     print('got cards')
-    for c in all_cards:
-        print(c.name)
-        m = re.match(
-            r"(?P<snap>.*?)(?:\s+\-\s+)(?P<version>.*?)(?:\s+\-\s+)"
-            r"\((?P<revision>.*?)\)(?:\s+\-\s+\[(?P<track>.*?)\])?", c.name)
-        for move in c.list_movements():
-            if(move['destination']['name'] == "Candidate"
-               and move['source']['name'] == 'Beta'):
-                notz = move['datetime'].replace(tzinfo=None)
-                diff = notz - c.card_created_date
-                diff.total_seconds()
-                print(diff.total_seconds)
-                ns = notz.timestamp() * 10 ** 9
-                try:
-                    influx_push(diff.total_seconds(), c.name.split(' ')[0], int(ns),
-                         m.group("revision"), m.group("version"))
-                except AttributeError:
-                    print("cards with no revision aren't helpful")
+    points = []
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        for card_points in executor.map(process_card, all_cards):
+            points.extend(card_points)
+    get_client().write_points(points, batch_size=5000)
+    print("{} measurements pushed to influx".format(len(points)))
 
 
 if __name__ == "__main__":
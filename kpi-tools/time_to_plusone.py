@@ -25,10 +25,18 @@ import time
 import os
 
 from dateutil import parser
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from influxdb import InfluxDBClient
 from trello import TrelloClient
 
 INFLUX_HOST = "10.50.124.12"
+DBNAME = "candidatesnaps"
+NSEC = 1_000_000_000
+
+CARD_RE = re.compile(
+    r"(?P<snap>.*?)(?:\s+\-\s+)(?P<version>.*?)(?:\s+\-\s+)"
+    r"\((?P<revision>.*?)\)(?:\s+\-\s+\[(?P<track>.*?)\])?")
 
 
 def environ_or_required(key):
@@ -39,11 +47,17 @@ def environ_or_required(key):
         return {'required': True}
 
 
+@lru_cache(maxsize=None)
+def get_client():
+    '''Get the (shared) influxdb client'''
+    return InfluxDBClient(INFLUX_HOST, 8086,
+                          "ce", os.environ.get("INFLUX_PASS"), DBNAME)
+
+
 def init_influx():
     '''Init influxdb with policy'''
-    dbname = "candidatesnaps"
-    client = InfluxDBClient(INFLUX_HOST, 8086,
-                            "ce", os.environ.get("INFLUX_PASS"), dbname)
+    dbname = DBNAME
+    client = get_client()
     dbs = client.get_list_database()
     if {u"name": dbname} not in dbs:
         client.create_database(dbname)
@@ -51,24 +65,7 @@ def init_influx():
                                        "350w", 1, default=True)
 
 
-def push_influx_generic(measurement, tags, time, fields):
-    '''Generic influx measurement pusher'''
-    dbname = "candidatesnaps"
-    client = InfluxDBClient(INFLUX_HOST, 8086,
-                            "ce", os.environ.get("INFLUX_PASS"), dbname)
-    body = [
-        {
-            "measurement": measurement,
-            "tags": tags,
-            "time": time,
-            "fields": fields
-        }
-    ]
-    client.write_points(body)
-    print("measurement: %s at: %s pushed to influx", measurement, str(time))
-
-
-def influx_push(age, snap, whenmoved, revno, version):
+def influx_point(age, snap, whenmoved, revno, version):
     tags = dict()
     fields = dict()
     tags['snap'] = snap
@@ -77,7 +74,39 @@ def influx_push(age, snap, whenmoved, revno, version):
     fields['time-to-plusone'] = age
     measure = 'time-to-plusone'
     print(version)
-    push_influx_generic(measure, tags, whenmoved, fields)
+    return {
+        "measurement": measure,
+        "tags": tags,
+        "time": whenmoved,
+        "fields": fields
+    }
+
+
+def process_card(c):
+    """
+    Build measurement points for a card from its 'Ready for Candidate'
+    sign-offs, found in the card's updateCheckItemStateOnCard actions.
+    """
+    points = []
+    m = CARD_RE.match(c.name)
+    acts = c.attriExp("updateCheckItemStateOnCard")
+    for act in acts:
+        if(act['type'] == 'updateCheckItemStateOnCard' and
+           act['data']['checklist']['name'] == 'Sign-Off' and
+           act['data']['checkItem']['name'] == "Ready for Candidate" and
+           act['data']['checkItem']['state'] == 'complete'):
+            when = parser.parse(act['date']).replace(tzinfo=None)
+            diff = when - c.card_created_date
+            print(diff.total_seconds())
+            ns = int(when.timestamp()) * NSEC + when.microsecond * 1000
+            print(ns)
+            try:
+                points.append(influx_point(
+                    diff.total_seconds(), c.name.split(' ')[0],
+                    ns, m.group("revision"), m.group("version")))
+            except AttributeError:
+                print("cards with no revision aren't helpful")
+    return points
 
 
 def main():
@@ -95,26 +124,12 @@ def main():
     client = TrelloClient(api_key=args.key, token=args.token)
     board = client.get_board(args.board)
     all_cards = board.get_cards(card_filter="open")
-    for c in all_cards:
-        m = re.match(
-            r"(?P<snap>.*?)(?:\s+\-\s+)(?P<version>.*?)(?:\s+\-\s+)"
-            r"\((?P<revision>.*?)\)(?:\s+\-\s+\[(?P<track>.*?)\])?", c.name)
-        acts = c.attriExp("updateCheckItemStateOnCard")
-        for act in acts:
-            if(act['type'] == 'updateCheckItemStateOnCard' and
-               act['data']['checklist']['name'] == 'Sign-Off' and
-               act['data']['checkItem']['name'] == "Ready for Candidate" and
-               act['data']['checkItem']['state'] == 'complete'):
-                when = parser.parse(act['date']).replace(tzinfo=None)
-                diff = when - c.card_created_date
-                print(diff.total_seconds())
-                ns = when.timestamp() * 10 ** 9
-                print(ns)
-                try:
-                    influx_push(diff.total_seconds(), c.name.split(' ')[0],
-                         int(ns), m.group("revision"), m.group("version"))
-                except AttributeError:
-                    print("cards with no revision aren't helpful")
+    points = []
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        for card_points in executor.map(process_card, all_cards):
+            points.extend(card_points)
+    get_client().write_points(points, batch_size=5000)
+    print("{} measurements pushed to influx".format(len(points)))
 
 
 if __name__ == "__main__":
@@ -3,6 +3,7 @@
 # This should only be run from a system with postfix installed
 
 import argparse
+import atexit
 import os
 import smtplib
 from email.mime.application import MIMEApplication
@@ -11,6 +12,9 @@ from email.mime.text import MIMEText
 
 SMTPSERVER = os.environ.get('SMTP_SERVER', 'localhost')
 
+# connection reused by all the send_mail calls, see _smtp()
+_SMTP = None
+
 ERROR_MSG = """
 ERROR!
 The email for this job was supposed to be located in {} but that file
@@ -55,7 +59,7 @@ def send_mail(to=None, subject="(No Subject)", body=None, attachments=None):
     if body:
         body = ('<html><body>'
                 '<font face="Courier New, Courier, monospace">'
-                '<pre>' + body + '</pre>'
+                f'<pre>{body}</pre>'
                 '</font></body></html>')
         body_part = MIMEText(body, 'html')
         msg.attach(body_part)
@@ -75,9 +79,34 @@ def send_mail(to=None, subject="(No Subject)", body=None, attachments=None):
     msg['From'] = 'noreply@canonical.com'
     msg['To'] = to
 
-    s = smtplib.SMTP(SMTPSERVER)
-    s.send_message(msg)
-    s.quit()
+    _smtp().send_message(msg)
+
+
+def _smtp():
+    """Get a live connection to the SMTP server, (re)connecting if needed."""
+    global _SMTP
+    if _SMTP is not None:
+        try:
+            if _SMTP.noop()[0] == 250:
+                return _SMTP
+        except smtplib.SMTPException:
+            pass
+        _close_smtp()
+    _SMTP = smtplib.SMTP(SMTPSERVER)
+    return _SMTP
+
+
+@atexit.register
+def _close_smtp():
+    global _SMTP
+    if _SMTP is None:
+        return
+    try:
+        _SMTP.quit()
+    except smtplib.SMTPException:
+        _SMTP.close()
+    finally:
+        _SMTP = None
 
 
 if __name__ == '__main__':
@@ -28,8 +28,11 @@ import pygsheets
 import re
 import logging
 import sys
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from fnmatch import fnmatch
+from itertools import islice
 
 """
 This programs keeps ODM projects' bugs in sync with the Somerville project.
@@ -45,6 +48,14 @@ status_list = ['New', 'Confirmed', 'Triaged', 'In Progress', 'Fix Committed',
         'Invalid', "Won't Fix", 'Incomplete']
 ODM_COMMENT_HEADER = '[Automated ODM-sync-tool comment]\n'
 
+BUG_URL_RE = re.compile(r'https://bugs.launchpad.net/bugs/(\d+)')
+BUG_NUMBER_RE = re.compile(r'Bug #(\d+)')
+
+# information every bug report has to include
+MANDATORY_ITEMS = [
+    'expected result', 'actual result', 'sku', 'bios version',
+    'image/manifest', 'cpu', 'gpu', 'reproduce steps', 'qmetry id']
+
 
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 
@@ -63,10 +74,10 @@ def find_bug_ref(text):
     >>> find_bug_ref('Bug #1834180')
     1834180
     """
-    match = re.compile(r'https://bugs.launchpad.net/bugs/(\d+)').search(text)
+    match = BUG_URL_RE.search(text)
     if match:
         return int(match.groups()[0])
-    match = re.compile(r'Bug #(\d+)').search(text)
+    match = BUG_NUMBER_RE.search(text)
     if match:
         return int(match.groups()[0])
 
@@ -75,12 +86,18 @@ class SyncTool:
     def __init__(self, credentials_file, config):
         self._cfg = config
         self._owners_spreadsheet = OwnersSpreadsheet(config)
+        self._credentials_file = credentials_file
+        # bugs are verified by multiple threads, each needs its own LP session
+        self._local = threading.local()
+        self._lock = threading.Lock()
         self.lp = Launchpad.login_with(
             'sync-odm-bugs', 'production',
             credentials_file=credentials_file)
         self.bug_db = dict()
         self.proj_db = dict()
         self.bug_xref_db = dict()
+        # umbrella bugs already loaded, keyed by the ODM bug id
+        self.umbrella_bug_db = dict()
         self.platform_map = dict()
         for proj in self._cfg.odm_projects + [self._cfg.umbrella_project]:
             self.bug_db[proj] = dict()
@@ -91,18 +108,20 @@ class SyncTool:
 
     def verify_bug(self, bug):
         comment = ''
-        last_updated = bug.bug.date_last_updated
+        # every `bug.bug` hop loads the bug from LP again, so keep it around
+        lp_bug = bug.bug
+        last_updated = lp_bug.date_last_updated
         if bug.status == 'Incomplete' and (datetime.datetime.now(
                 last_updated.tzinfo) - last_updated).days > 14:
             comment = 'No activity for more than 14 days'
-            logging.info("%s on bug %s", comment, bug.bug.id)
+            logging.info("%s on bug %s", comment, lp_bug.id)
             self._add_comment(bug, comment)
             bug.status = 'Invalid'
             bug.lp_save()
         if bug.status == 'Incomplete':
             return False
-        if ('checkbox' not in bug.bug.tags and
-                'cpm-reviewed' not in bug.bug.tags):
+        tags = lp_bug.tags
+        if 'checkbox' not in tags and 'cpm-reviewed' not in tags:
             comment = (
                 "Bug report isn't tagged with either 'checkbox' or"
                 " 'cpm-reviewed'. Marking as incomplete.")
@@ -110,18 +129,19 @@ class SyncTool:
             bug.status = 'Incomplete'
             bug.lp_save()
             return False
-        for tag in bug.bug.tags:
+        for tag in tags:
             if tag in self._owners_spreadsheet.owners.keys():
-                self.platform_map[bug.bug.id] = tag
+                with self._lock:
+                    self.platform_map[lp_bug.id] = tag
                 break
         else:
             comment = "Bug report isn't tagged with a platform tag"
             self._add_comment(bug, comment)
             bug.status = 'Incomplete'
             bug.lp_save()
-        for msg in bug.bug.messages:
-            atts = [a for a in msg.bug_attachments]
-            if any([fnmatch(a.title, 'sosreport*.tar.xz') for a in atts]):
+        for msg in lp_bug.messages:
+            if any(fnmatch(a.title, 'sosreport*.tar.xz')
+                   for a in msg.bug_attachments):
                 break
         else:
             comment = 'Missing sosreport attachment'
@@ -130,14 +150,10 @@ class SyncTool:
             bug.lp_save()
 
 
-        mandatory_items = [
-            'expected result', 'actual result', 'sku', 'bios version',
-            'image/manifest', 'cpu', 'gpu', 'reproduce steps', 'qmetry id']
-
-        missing = []
-        for item in mandatory_items:
-            if not re.search(item, bug.bug.description, flags=re.IGNORECASE):
-                missing.append(item)
+        # the items are plain words, so a case-insensitive substring test is
+        # all that's needed
+        description = lp_bug.description.lower()
+        missing = [item for item in MANDATORY_ITEMS if item not in description]
         if missing:
             comment = ('Marking as Incomplete because of missing information:'
                        ' {}'.format(', '.join(missing)))
@@ -147,29 +163,47 @@ class SyncTool:
 
         return not comment
 
+    def _launchpad(self):
+        """Log in to Launchpad once per bug verifying thread of main()."""
+        launchpad = getattr(self._local, 'launchpad', None)
+        if launchpad is None:
+            launchpad = Launchpad.login_with(
+                'sync-odm-bugs', 'production',
+                credentials_file=self._credentials_file)
+            self._local.launchpad = launchpad
+        return launchpad
+
+    def _verify_bug_link(self, link):
+        return self.verify_bug(self._launchpad().load(link))
+
     def add_bug_to_db(self, bug):
         self.bug_db[bug.bug_target_name][bug.bug.title] = bug.bug
 
     def build_bug_db(self):
+        # bugs synced to the umbrella have the reference to the ODM bug
+        # in their first comment; read them all once up front, as every
+        # message fetch is a roundtrip to LP
+        synced_bugs = dict()
+        for u_title, u_bug in self.bug_db[
+                self._cfg.umbrella_project].items():
+            if u_bug.messages.total_size >= 2:
+                first_comment = u_bug.messages[1].content
+                if first_comment.startswith(ODM_COMMENT_HEADER):
+                    bug_no = find_bug_ref(first_comment)
+                    synced_bugs.setdefault(bug_no, (u_title, u_bug))
         for proj, proj_bugs in self.bug_db.items():
             if proj == self._cfg.umbrella_project:
                 continue
             for bug_title, bug in proj_bugs.items():
                 logging.debug("Checking if %s is in the umbrella", bug_title)
                 # look for bug in the umbrella project
-                for u_title, u_bug in self.bug_db[
-                        self._cfg.umbrella_project].items():
-                    if u_bug.messages.total_size >= 2:
-                        first_comment = u_bug.messages[1].content
-                        if first_comment.startswith(ODM_COMMENT_HEADER):
-                            bug_no = find_bug_ref(first_comment)
-                            if bug_no == bug.id:
-                                logging.debug(
-                                    "bug %s already defined in umbrella",
-                                    u_title)
-                                self.bug_xref_db[bug.id] = u_bug.id
-                                self.bug_xref_db[u_bug.id] = bug.id
-                                break
+                if bug.id in synced_bugs:
+                    u_title, u_bug = synced_bugs[bug.id]
+                    logging.debug(
+                        "bug %s already defined in umbrella", u_title)
+                    self.bug_xref_db[bug.id] = u_bug.id
+                    self.bug_xref_db[u_bug.id] = bug.id
+                    self.umbrella_bug_db[bug.id] = u_bug
                 else:
                     bug_task = bug.bug_tasks[0]
                     if bug.id not in self.platform_map.keys():
@@ -184,12 +218,13 @@ class SyncTool:
                         self._cfg.umbrella_project, '[ODM bug] ' + bug_title,
                         bug.description, bug_task.status,
                         bug.tags + [proj, 'odm-bug'], owner)
-                    self.add_bug_to_db(new_bug.bug_tasks[0])
+                    new_bug_task = new_bug.bug_tasks[0]
+                    self.add_bug_to_db(new_bug_task)
                     self.bug_xref_db[bug.id] = new_bug.id
                     self.bug_xref_db[new_bug.id] = bug.id
                     message = ('This bug is from [{}] Launchpad project.'
                                '\nPlease refer to Bug #{}'.format(proj, bug.id))
-                    self._add_comment(new_bug.bug_tasks[0], message)
+                    self._add_comment(new_bug_task, message)
                     message = ('This bug has been synced to {} Launchpad'
                                ' project successfully.\nPlease refer to Bug'
                                ' #{}'.format(
@@ -199,10 +234,14 @@ class SyncTool:
     def sync_all(self):
         for proj in self._cfg.odm_projects:
             for odm_bug_name, odm_bug in self.bug_db[proj].items():
-                umb_bug = self.lp.bugs[self.bug_xref_db[odm_bug.id]]
-                odm_messages = [msg for msg in odm_bug.messages][1:]
-                umb_messages = [msg for msg in umb_bug.messages][1:]
-                odm_comments = []
+                umb_bug = self.umbrella_bug_db.get(odm_bug.id)
+                if umb_bug is None:
+                    umb_bug = self.lp.bugs[self.bug_xref_db[odm_bug.id]]
+                odm_messages = list(islice(odm_bug.messages, 1, None))
+                umb_messages = list(islice(umb_bug.messages, 1, None))
+                # every bug_tasks lookup is a request to LP
+                odm_bug_task = odm_bug.bug_tasks[0]
+                umb_bug_task = umb_bug.bug_tasks[0]
                 def fake_content(msg):
                     """Create a fake content out of attachment titles."""
                     new_content = '__Empty_comment__attachments: '
@@ -218,7 +257,7 @@ class SyncTool:
                     return new_content
                 def trim_messages(messages):
                     """Remove automatically added headers from the comments."""
-                    trimmed_comments = []
+                    trimmed_comments = set()
                     for msg in messages:
                         if msg.content.startswith(ODM_COMMENT_HEADER):
                             trimmed_lines = []
@@ -229,15 +268,16 @@ class SyncTool:
                             new_comment = '\n'.join(trimmed_lines)
                             if not new_comment:
                                 new_comment = fake_content(msg)
-                            trimmed_comments.append(new_comment)
+                            trimmed_comments.add(new_comment)
                         else:
-                            trimmed_comments.append(msg.content)
+                            trimmed_comments.add(msg.content)
                     return trimmed_comments
 
+                # the message lists don't change while syncing, so the
+                # comments are compared against sets built only once
+                trimmed_umb_comments = trim_messages(umb_messages)
+                trimmed_odm_comments = trim_messages(odm_messages)
                 for msg in odm_messages:
-                    odm_comments.append(msg.content or fake_content(msg))
-                for msg in odm_messages:
-                    trimmed_umb_comments = trim_messages(umb_messages)
                     if msg.content and msg.content in trimmed_umb_comments:
                         continue
                     if msg.content.startswith(ODM_COMMENT_HEADER):
@@ -250,17 +290,17 @@ class SyncTool:
                     # LP lets us view the hidden comments, but not their
                     # attachments
                     try:
-                        attachments = [a for a in msg.bug_attachments]
+                        # only the first attachment can be copied over
+                        attachments = list(islice(msg.bug_attachments, 1))
                         content = (
                             '[Original comment posted on {} by {}]\n{}'.format(
                                 msg.date_created.strftime('%Y-%m-%d %H:%M:%S'),
                                 msg.owner.name, msg.content))
                         self._add_comment(
-                            umb_bug.bug_tasks[0], content, attachments)
+                            umb_bug_task, content, attachments)
                     except NotFound as exc:
                         logging.info('Skipping comment (Probably hidden)')
                 for msg in umb_messages:
-                    trimmed_odm_comments = trim_messages(odm_messages)
                     if msg.content and msg.content in trimmed_odm_comments:
                         continue
                     if msg.content.startswith(ODM_COMMENT_HEADER):
@@ -271,53 +311,56 @@ class SyncTool:
                     logging.info('Adding missing comment from %s to %s',
                                  self._cfg.umbrella_project, proj)
                     try:
-                        attachments = [a for a in msg.bug_attachments]
+                        # only the first attachment can be copied over
+                        attachments = list(islice(msg.bug_attachments, 1))
                         content = (
                             '[Original comment posted on {} by {}]\n{}'.format(
                                 msg.date_created.strftime('%Y-%m-%d %H:%M:%S'),
                                 msg.owner.name, msg.content))
                         self._add_comment(
-                            odm_bug.bug_tasks[0], content, attachments)
+                            odm_bug_task, content, attachments)
                     except NotFound as exc:
                         logging.info('Skipping comment (Probably hidden)')
-                self._sync_meta(odm_bug, umb_bug)
+                self._sync_meta(odm_bug, umb_bug, odm_bug_task, umb_bug_task)
 
-    def _sync_meta(self, bug1, bug2):
+    def _sync_meta(self, bug1, bug2, bug_task1, bug_task2):
         if bug1.date_last_updated > bug2.date_last_updated:
-            src = bug1
-            dest = bug2
+            src, src_bt = bug1, bug_task1
+            dest, dest_bt = bug2, bug_task2
         else:
-            src = bug2
-            dest = bug1
+            src, src_bt = bug2, bug_task2
+            dest, dest_bt = bug1, bug_task1
         changed = False
+        prefix = self._cfg.umbrella_prefix
         # for comparing titles we need to make sure the prefix is removed
-        src_title = src.title.split(self._cfg.umbrella_prefix, maxsplit=1)[-1]
-        dest_title = dest.title.split(self._cfg.umbrella_prefix, maxsplit=1)[-1]
+        src_full_title = src.title
+        src_title = src_full_title.split(prefix, maxsplit=1)[-1]
+        dest_title = dest.title.split(prefix, maxsplit=1)[-1]
         if src_title != dest_title:
-            if src.title.startswith(self._cfg.umbrella_prefix):
+            if src_full_title.startswith(prefix):
                 # copying FROM umbrella bug so the prefix is already stripped
                 dest.title = src_title
             else:
                 # copying TO umbrella bug so we need to add the prefix
-                dest.title = self._cfg.umbrella_prefix + src_title
+                dest.title = prefix + src_title
             changed = True
 
-        if src.description != dest.description:
-            dest.description = src.description
+        src_description = src.description
+        if src_description != dest.description:
+            dest.description = src_description
             changed = True
 
-        if src.tags != dest.tags:
-            dest.tags = src.tags
+        src_tags = src.tags
+        if src_tags != dest.tags:
+            dest.tags = src_tags
             changed = True
 
-        # get bug_task for both bugs
-        src_bt = src.bug_tasks[0]
-        dest_bt = dest.bug_tasks[0]
         bt_changed = False
 
         for f in ['assignee', 'status', 'milestone', 'importance']:
-            if getattr(src_bt, f) != getattr(dest_bt, f):
-                setattr(dest_bt, f, getattr(src_bt, f))
+            value = getattr(src_bt, f)
+            if value != getattr(dest_bt, f):
+                setattr(dest_bt, f, value)
                 bt_changed = True
 
         if changed:
@@ -361,8 +404,18 @@ class SyncTool:
             bug_tasks = project.searchTasks(
                 status=status_list, tags=["dm-reviewed"],
                 created_since=start_date)
-            for bug in bug_tasks:
-                if self.verify_bug(bug):
+            bug_tasks = list(bug_tasks)
+            # load the owners before the threads start using them, the
+            # spreadsheet client is not thread-safe
+            self._owners_spreadsheet.owners
+            # verifying is mostly waiting for LP, so do it for many bugs
+            # at once
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                verified = list(executor.map(
+                    self._verify_bug_link,
+                    [bug.self_link for bug in bug_tasks]))
+            for bug, is_valid in zip(bug_tasks, verified):
+                if is_valid:
                     self.add_bug_to_db(bug)
         project = self.lp.projects[self._cfg.umbrella_project]
         bug_tasks = project.searchTasks(
@@ -382,16 +435,21 @@ class OwnersSpreadsheet:
 
     @property
     def owners(self):
-        if not self._owners:
+        if self._owners is None:
             sheet = self._gcli.open_by_key(
                 self._cfg.tracking_doc_id)
-            column_j = sheet.worksheet_by_title(
-                'Platforms').get_col(10)[2:]
+            PLATFORM_COLUMN = 10
             OWNER_COLUMN = 49
-            column_ar = sheet.worksheet_by_title(
-                'Platforms').get_col(OWNER_COLUMN)[2:]
-            self._owners = dict()
-            for platform, raw_owner in zip(column_j, column_ar):
+            wsheet = sheet.worksheet_by_title('Platforms')
+            # get both columns (and the ones in between) in one request,
+            # skipping the header rows
+            rows = wsheet.get_values(
+                (3, PLATFORM_COLUMN), (wsheet.rows, OWNER_COLUMN),
+                include_tailing_empty=True)
+            owners = dict()
+            for row in rows:
+                platform = row[0]
+                raw_owner = row[OWNER_COLUMN - PLATFORM_COLUMN]
                 if not raw_owner:
                     logging.warning(
                         "%s platform doesn't have an owner!", platform)
@@ -403,13 +461,15 @@ class OwnersSpreadsheet:
                     continue
                 if not platform:
                     continue
-                if platform in self._owners.keys():
+                if platform in owners:
                     logging.debug('%s platform already registered', platform)
-                    if self._owners[platform] != owner:
+                    if owners[platform] != owner:
                         logging.warning(
                             'And the owner is different! Previous %s, now %s',
-                            self._owners[platform], owner)
-                self._owners[platform] = owner
+                            owners[platform], owner)
+                owners[platform] = owner
+            # publish the mapping only once it is complete
+            self._owners = owners
         return self._owners
 
 
@@ -18,10 +18,13 @@
 import json
 import os
 import re
-import subprocess
+import shutil
+import urllib.request
 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 """
 Pull historical results from Jenkins for quick import to InfluxDB.
@@ -52,46 +55,57 @@ PROJECTS = [
 
 JENKINS = 'http://10.101.50.238:8080/'
 
+# date and time of a build, as found in the console log
+TIMESTAMP_RE = re.compile(r'\d{4}-\d{2}-\d{2}\ \d{2}:\d{2}:\d{2}')
+
 class WgetError(Exception):
     pass
 
 def wget(url, filename=None):
-    # this is needed as no python-wget or requests on yantok
+    # there's no python-wget or requests on yantok, so stick to urllib
     # if filename is None return the wgotten file as string
-    cmd = ['wget', '-q', '-O', filename or '-', url]
     try:
-        out = subprocess.check_output(cmd)
-        return out.decode('utf-8')
-    except subprocess.CalledProcessError:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            if filename is None:
+                return response.read().decode('utf-8')
+            with open(filename, 'wb') as f:
+                shutil.copyfileobj(response, f, 1 << 16)
+    except OSError:
         raise WgetError
 
-def get_latest_builds():
+def get_last_build(proj):
     url = JENKINS + 'job/{job_name}/api/json'
-    builds = dict()
-    for proj in PROJECTS:
-        try:
-            res = wget(url.format(job_name=proj))
-        except WgetError:
-            print('Unable to fetch "{}" jenkins project information. '
-                  'Is the project still available?'.format(proj))
-            continue
-        job_desc = json.loads(res)
-        try:
-            builds[proj] = job_desc['lastBuild']['number']
-        except KeyError:
-            print('failed to get last build number for {}'.format(proj))
-    return builds
-
-def pull(proj, index):
+    try:
+        res = wget(url.format(job_name=proj))
+    except WgetError:
+        print('Unable to fetch "{}" jenkins project information. '
+              'Is the project still available?'.format(proj))
+        return None
+    job_desc = json.loads(res)
+    try:
+        return job_desc['lastBuild']['number']
+    except KeyError:
+        print('failed to get last build number for {}'.format(proj))
+        return None
+
+def get_latest_builds():
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        last_builds = executor.map(get_last_build, PROJECTS)
+    return {
+        proj: last_build for proj, last_build in zip(PROJECTS, last_builds)
+        if last_build is not None
+    }
+
+def pull(proj, index, directory):
     print('pulling artifacts of job #{} for {}'.format(index, proj))
     base_url = JENKINS + 'view/Core/job/{}/{}/'.format(proj, index)
     snap_url = base_url + 'artifact/artifacts/snaplist.txt/*view*/'
     console_url = base_url + 'consoleText'
     submission_url = base_url + 'artifact/artifacts/submission.json/*view*/'
     try:
-        wget(console_url, 'meta')
-        wget(submission_url, 'submission.json')
-        wget(snap_url, 'snaplist')
+        wget(console_url, os.path.join(directory, 'meta'))
+        wget(submission_url, os.path.join(directory, 'submission.json'))
+        wget(snap_url, os.path.join(directory, 'snaplist'))
     except WgetError:
         return False
     return True
@@ -99,39 +113,35 @@ def pull(proj, index):
 
 def download_artifacts(projects):
     # this is file-system stateful so it's easier to debug/reuse
-    latest_good = dict()
+    pulls = []
     for proj in projects.keys():
         os.makedirs(proj, exist_ok=True)
-        os.chdir(proj)
-        # let's create a copy so we can modify original while iterating
-        builds = projects[proj][:]
-        for index in builds:
-            if os.path.exists(str(index)):
+        for index in projects[proj]:
+            build_dir = os.path.join(proj, str(index))
+            if os.path.exists(build_dir):
                 print("{}/{} already exists. Skipping.".format(proj, index))
                 continue
-            os.mkdir(str(index))
-            os.chdir(str(index))
-            try:
-                pull(proj, index)
-                os.chdir('..')
-            except WgetError:
-                os.chdir('..')
-                shutil.rmtree(str(index), ignore_errors=True)
-                proj.remove(index)
-                shutil.rmtree(str(index), ignore_errors=True)
-        os.chdir('..')
-
+            os.mkdir(build_dir)
+            pulls.append((proj, index, build_dir))
+    # builds are independent, so pull a few of them at once
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        pulled = list(executor.map(lambda args: pull(*args), pulls))
+    for (proj, index, build_dir), success in zip(pulls, pulled):
+        if not success:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            projects[proj].remove(index)
+
+@lru_cache(maxsize=None)
 def extract_timestamp(path):
-    dt = None
+    # console logs can be huge and the timestamp is near the top, so read
+    # only as much as needed
     with open(os.path.join(path, 'meta'), 'rt') as f:
-        for line in f.readlines():
-            regex = re.compile(r'\d{4}-\d{2}-\d{2}\ \d{2}:\d{2}:\d{2}')
-            match = regex.match(line)
+        for line in f:
+            match = TIMESTAMP_RE.match(line)
             if match:
-                dt = datetime.strptime(
+                return datetime.strptime(
                     match.group(), '%Y-%m-%d %H:%M:%S')
-                break
-    return dt
+    return None
 
 def measurement_tool_invocation(projects):
     for proj in projects.keys():
@@ -148,8 +158,12 @@ def measurement_tool_invocation(projects):
                 print(' '.join(cmd))
 
 def push_results(projects):
-    from measure_snappy_jobs import InfluxQueryWriter, push_to_influx
+    from measure_snappy_jobs import (
+        InfluxQueryWriter, SubmissionParseError, push_to_influx,
+        read_submission)
     problems = []
+    # all the builds are pushed in one go, the client splits them in batches
+    measurements = []
     for proj in projects.keys():
         for index in projects[proj]:
             val = extract_timestamp(os.path.join(proj, str(index)))
@@ -157,14 +171,14 @@ def push_results(projects):
                 timestamp = (val - datetime(1970, 1, 1)) / timedelta(seconds=1)
                 submission_file = os.path.join(
                     proj, str(index), 'submission.json')
-                with open(submission_file, 'rt', encoding='utf-8') as f:
-                    try:
-                        content = json.load(f)
-                    except json.JSONDecodeError:
-                        print("Failed to parse {}".format(submission_file))
-                        continue
+                try:
+                    content = read_submission(submission_file)
                     iqw = InfluxQueryWriter(proj, content, timestamp)
-                    res = push_to_influx(iqw.extract_measurements())
+                    measurements.extend(iqw.extract_measurements())
+                except SubmissionParseError:
+                    print("Failed to parse {}".format(submission_file))
+    if measurements:
+        push_to_influx(measurements)
     return problems
 
 
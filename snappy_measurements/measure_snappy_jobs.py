@@ -16,11 +16,14 @@
 # Written by:
 #       Maciej Kisielewski <maciej.kisielewski@canonical.com>
 import argparse
+import itertools
 import json
 import os
 import re
 import time
 
+from functools import lru_cache
+
 from influx_credentials import credentials
 
 """
@@ -44,10 +47,24 @@ MEASURED_JOBS = [
 
 BOOTUP_JOB_ID = 'info/systemd-analyze'
 
+NSEC = 1_000_000_000
+
+# XXX: fractions of a seconds can be printed in two ways depending if
+# there are whole seconds to report
+SYSD_DURATION_RE = re.compile(
+    r'[^\d]*(?:\s?(?P<hours>\d+)h)?(?:\s?(?P<minutes>\d+)min)?'
+    r'(?:\s?(?P<seconds>\d+(?:\.\d*)?)s)?(?:\s?(?P<millis>\d+)ms)?')
+SYSD_LABEL_RE = re.compile(r'\((.+)\)')
+
 
 def dquote(s):
     # surround s with double quotes
-    return '"{}"'.format(s)
+    return f'"{s}"'
+
+
+# job names as used in the measurement tags
+MEASURED_JOB_NAMES = {job: dquote(job) for job in MEASURED_JOBS}
+BOOTUP_JOB_NAME = dquote(BOOTUP_JOB_ID)
 
 
 def to_human_name(hw_id):
@@ -63,7 +80,7 @@ class InfluxQueryWriter():
 
     def __init__(self, hw_id, submission, tstamp=None):
         self._proj = dquote(submission.get('title', 'unknown'))
-        self._time = int(tstamp * 10 ** 9)
+        self._time = int(tstamp * NSEC)
         self._hw_id = dquote(to_human_name(hw_id))
         self._os_kind = dquote(submission.get('distribution', dict()).get(
             'description', 'unknown'))
@@ -75,69 +92,72 @@ class InfluxQueryWriter():
         else:
             self._core_rev = '0'
         self._results = (
-            submission.get('results', []) +
-            submission.get('resource-results', [])
+            submission.get('results', []),
+            submission.get('resource-results', []),
         )
+        # tags are the same for all measurements of a job, so they are built
+        # once and shared by the measurements
+        self._job_tags = {
+            job: {
+                "project_name": self._proj,
+                "job_name": job_name,
+                "hw_id": self._hw_id,
+                "os_kind": self._os_kind,
+                "core_revision": self._core_rev,
+            } for job, job_name in (
+                list(MEASURED_JOB_NAMES.items()) +
+                [(BOOTUP_JOB_ID, BOOTUP_JOB_NAME)])
+        }
 
     def generate_sql_inserts(self):
         TMPL = ("INSERT snap_timing,project_name={proj},job_name={job},"
-                "hw_id={hw},os_kind={os},core_revision={core_rev} "
-                "elapsed={elapsed} {tstamp}")
-        for m in self.extract_measurements():
-            yield TMPL.format(
-                proj=m['tags']['project_name'],
-                job=m['tags']['job_name'],
-                hw=m['tags']['hw_id'],
-                os=m['tags']['os_kind'],
-                core_rev=m['tags']['core_revision'],
-                elapsed=m['fields']['elapsed'],
-                tstamp=m['time'])
+                "hw_id={hw},os_kind={os},core_revision={core_rev} ")
+        # everything up to the field is the same for all the job's inserts
+        heads = {
+            job: TMPL.format(
+                proj=tags['project_name'],
+                job=tags['job_name'],
+                hw=tags['hw_id'],
+                os=tags['os_kind'],
+                core_rev=tags['core_revision'])
+            for job, tags in self._job_tags.items()
+        }
+        tstamp = str(self._time)
+        for job, elapsed in self._extract_timings():
+            yield f'{heads[job]}elapsed={elapsed} {tstamp}'
 
     def extract_measurements(self):
-        for result in self._results:
+        for job, elapsed in self._extract_timings():
+            yield {
+                "measurement": "snap_timing",
+                "tags": self._job_tags[job],
+                "time": self._time,
+                "fields": {
+                    "elapsed": elapsed,
+                }
+            }
+
+    def _extract_timings(self):
+        """Generate (job, elapsed time) pairs for the measured jobs."""
+        measured_jobs = tuple(MEASURED_JOBS)
+        for result in itertools.chain(*self._results):
+            result_id = result['id']
             # for some jobs extract elapsed time as measured by checkbox
-            for job in MEASURED_JOBS:
-                if result['id'].endswith(job):
-                    if not result.get('duration'):
-                        continue
-                    measurement = {
-                        "measurement": "snap_timing",
-                        "tags": {
-                            "project_name": self._proj,
-                            "job_name": dquote(job),
-                            "hw_id": self._hw_id,
-                            "os_kind": self._os_kind,
-                            "core_revision": self._core_rev,
-                        },
-                        "time": self._time,
-                        "fields": {
-                            "elapsed": result["duration"],
-                        }
-                    }
-                    yield measurement
+            if result_id.endswith(measured_jobs):
+                if not result.get('duration'):
+                    continue
+                job = next(
+                    job for job in MEASURED_JOBS if result_id.endswith(job))
+                yield job, result['duration']
             # for boot-up job extract time from the job's output
-            if result['id'].endswith(BOOTUP_JOB_ID):
+            elif result_id.endswith(BOOTUP_JOB_ID):
                 timings = parse_sysd_analyze(result['io_log'])
                 if 'total' not in timings.keys():
                     print("{} job didn't have proper output."
                           " It returned:\n{}".format(
                               result['id'], result['io_log']))
                 else:
-                    measurement = {
-                        "measurement": "snap_timing",
-                        "tags": {
-                            "project_name": self._proj,
-                            "job_name": dquote(BOOTUP_JOB_ID),
-                            "hw_id": self._hw_id,
-                            "os_kind": self._os_kind,
-                            "core_revision": self._core_rev,
-                        },
-                        "time": self._time,
-                        "fields": {
-                            "elapsed": timings['total'],
-                        }
-                    }
-                    yield measurement
+                    yield BOOTUP_JOB_ID, timings['total']
 
 
 def parse_sysd_analyze(text):
@@ -181,37 +201,101 @@ def parse_sysd_analyze(text):
         return
 
     def extract(tx):
-        # XXX: fractions of a seconds can be printed in two ways depending if
-        # there are whole seconds to report
-        RE = (r'[^\d]*(?P<hours>\s?\d+h)?(?P<minutes>\s?\d+min)?'
-              '(?P<seconds>\s?\d+(\.\d*)?s)?(?P<millis>\s?\d+ms)?')
-        groups = re.match(RE, tx).groupdict()
-        hours = (groups['hours'] or '0h')[:-1]
-        minutes = (groups['minutes'] or '0min')[:-3]
-        seconds = (groups['seconds'] or '0s')[:-1]
-        milliseconds = (groups['millis'] or '0ms')[:-2]
-        res = (float(hours) * 3600 + float(minutes) * 60 + float(seconds) +
-               float(milliseconds) / 1000)
+        groups = SYSD_DURATION_RE.match(tx).groupdict(default='0')
+        res = (float(groups['hours']) * 3600 +
+               float(groups['minutes']) * 60 +
+               float(groups['seconds']) +
+               float(groups['millis']) / 1000)
         return res
     head, tail = text.split('=')
     res = {'total': extract(tail)}
     segments = head.split('+')
     for seg in segments:
-        label = re.search(r'\((.+)\)', seg).groups()[0]
+        label = SYSD_LABEL_RE.search(seg).groups()[0]
         res[label] = extract(seg)
     return res
 
 
-def push_to_influx(measurements):
+@lru_cache()
+def get_influx_client():
     from influxdb import InfluxDBClient
-    client = InfluxDBClient(
+    return InfluxDBClient(
         credentials['host'],
         8086,
         credentials['user'],
         os.environ.get("INFLUX_PASS") or credentials['pass'],
-        credentials['dbname']
+        credentials['dbname'],
+        gzip=True
     )
-    client.write_points(measurements)
+
+
+class SubmissionParseError(Exception):
+    pass
+
+
+class StreamedItems:
+    """
+    Items of a JSON array in a file, parsed one at a time when iterated.
+
+    The file is parsed again on every iteration, so only one item is kept in
+    memory at a time.
+    """
+
+    def __init__(self, path, prefix):
+        self._path = path
+        self._prefix = prefix
+
+    def __iter__(self):
+        import ijson
+        with open(self._path, 'rb') as f:
+            yield from ijson.items(f, self._prefix, use_float=True)
+
+
+def read_submission(path):
+    """
+    Read the parts of a submission file needed to extract measurements.
+
+    When ijson is available, the metadata is read in a first pass over the
+    file, and the results and resource-results are streamed from the file,
+    in one more pass each, when they're iterated over. That's three parses
+    of the file, traded for not having to keep big submissions in memory.
+    Without ijson the whole file is loaded with json.
+
+    Raises SubmissionParseError if the file is not valid JSON.
+    """
+    try:
+        import ijson
+    except ImportError:
+        with open(path, 'rt', encoding='utf-8') as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError as exc:
+                raise SubmissionParseError(exc) from exc
+    submission = dict()
+    with open(path, 'rb') as f:
+        try:
+            for prefix, event, value in ijson.parse(f, use_float=True):
+                if prefix == 'title':
+                    submission['title'] = value
+                elif prefix == 'distribution.description':
+                    submission['distribution'] = {'description': value}
+                elif prefix == 'snap-packages.item' and event == 'start_map':
+                    snap = dict()
+                    submission.setdefault('snap-packages', []).append(snap)
+                elif prefix in ('snap-packages.item.name',
+                                'snap-packages.item.revision'):
+                    snap[prefix.rsplit('.', 1)[-1]] = value
+        except ijson.JSONError as exc:
+            raise SubmissionParseError(exc) from exc
+    submission['results'] = StreamedItems(path, 'results.item')
+    submission['resource-results'] = StreamedItems(
+        path, 'resource-results.item')
+    return submission
+
+
+def push_to_influx(measurements):
+    get_influx_client().write_points(
+        list(measurements), time_precision='n', batch_size=5000)
 
 
 def push_using_bridge(measurements):
@@ -236,21 +320,16 @@ def main():
     args = parser.parse_args()
 
     try:
-        with open(args.SUBMISSION_FILE, 'rt') as f:
-            try:
-                content = json.load(f)
-            except json.JSONDecodeError:
-                raise SystemExit("Failed to parse {}".format(
-                    args.SUBMISSION_FILE))
-            iqw = InfluxQueryWriter(args.hw_id, content, args.timestamp)
-            if args.sql:
-                print('\n'.join(iqw.generate_sql_inserts()))
-            elif args.bridge:
-                return push_using_bridge(iqw.extract_measurements())
-            else:
-                push_to_influx(iqw.extract_measurements())
-    except Exception as exc:
-        raise exc
+        content = read_submission(args.SUBMISSION_FILE)
+        iqw = InfluxQueryWriter(args.hw_id, content, args.timestamp)
+        if args.sql:
+            print('\n'.join(iqw.generate_sql_inserts()))
+        elif args.bridge:
+            return push_using_bridge(iqw.extract_measurements())
+        else:
+            push_to_influx(iqw.extract_measurements())
+    except SubmissionParseError:
+        raise SystemExit("Failed to parse {}".format(args.SUBMISSION_FILE))
 
 
 if __name__ == '__main__':
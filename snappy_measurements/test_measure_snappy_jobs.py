@@ -15,11 +15,14 @@
 # Written by:
 #       Maciej Kisielewski <maciej.kisielewski@canonical.com>
 
+import json
+import os
+import tempfile
 import unittest
 
 from unittest.mock import MagicMock
 
-from measure_snappy_jobs import InfluxQueryWriter
+from measure_snappy_jobs import InfluxQueryWriter, read_submission
 
 
 class InfluxQueryWriterTests(unittest.TestCase):
@@ -69,3 +72,34 @@ class InfluxQueryWriterTests(unittest.TestCase):
             iqw = InfluxQueryWriter('unknown', submission, 1)
             self.assertEqual(
                 list(iqw.generate_sql_inserts()), [expected1, expected2])
+
+
+class ReadSubmissionTests(unittest.TestCase):
+    def test_streamed_same_as_loaded(self):
+        submission = {
+            'results': [
+                {'id': 'com.canonical.certification::snap-install',
+                 'duration': 1.5},
+                {'id': 'info/systemd-analyze',
+                 'io_log': 'Startup finished in 5.459s (kernel)'
+                           ' + 18.985s (userspace) = 24.444s'},
+            ],
+            'title': 'checkbox-project',
+            'distribution': {'description': 'Ubuntu Core 22'},
+            'snap-packages': [
+                {'name': 'snapd', 'revision': '17950'},
+                {'name': 'core', 'revision': '16202'},
+            ],
+            'resource-results': [{'id': 'snap-remove', 'duration': 2.5}],
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'submission.json')
+            with open(path, 'wt') as f:
+                json.dump(submission, f)
+            streamed = InfluxQueryWriter(
+                'unknown', read_submission(path), 1)
+            loaded = InfluxQueryWriter('unknown', submission, 1)
+            self.assertEqual(
+                list(streamed.generate_sql_inserts()),
+                list(loaded.generate_sql_inserts()))
+            self.assertEqual(len(list(loaded.generate_sql_inserts())), 3)